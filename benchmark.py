@@ -0,0 +1,210 @@
+# ===================================================================
+# Benchmark suite for encode / decode / framing hot paths
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Runs offline, end-to-end cases use an in-memory SimulatedFC loopback.
+#   python benchmark.py                       # run everything
+#   python benchmark.py -k RC                 # only cases matching "RC"
+#   python benchmark.py --save base.json      # store a baseline
+#   python benchmark.py --compare base.json   # diff against a baseline
+#   python benchmark.py --legacy              # codec vs pre-codec speedup
+# ===================================================================
+import argparse, json, platform, subprocess, sys, time, tracemalloc
+from timeit import timeit
+from lib import MultiWii, Command, Stream, ByteCode as BC
+from lib.Simulator import SimulatedFC
+
+# Target duration of one timing round, best of REPEAT rounds is kept
+ROUND_TIME = 0.05
+REPEAT = 3
+# Relative slowdown reported as a regression by --compare
+THRESHOLD = 0.10
+
+
+def commands(base: type, simple: bool = False):
+    for key, CMD in sorted(Command.COMMANDS.by_name.items()):
+        if issubclass(CMD, base) and (CMD.simple or not simple):
+            yield key, CMD
+
+
+def arguments(CMD: type[Command.WriteCMD]) -> tuple:
+    # Distinct (in range) values for flat commands, defaults for compound fields
+    if not CMD.simple:
+        return ()
+    return tuple(max(i, dtype.min) for i, dtype in enumerate(CMD.struct.values()))
+
+
+def cases():
+    # (case name, callable) for every hot path and command class
+    for name in ["U8", "U16", "U32", "U64", "I8", "I16", "I32", "I64"]:
+        dtype = getattr(BC, name)
+        yield f"TypedInteger/{name}", lambda dtype=dtype: dtype(100)
+    for key, CMD in commands(Command.ReadCMD):
+        cmd, data = CMD(), bytes(range(CMD.size))
+        yield f"ReadCMD.fromBytes/{key}", lambda cmd=cmd, data=data: cmd.fromBytes(data)
+        yield f"ReadCMD.to_dict/{key}", lambda cmd=cmd, data=data: (
+            cmd.fromBytes(data).to_dict()
+        )
+        fields = tuple(CMD.struct)[:2]
+        yield f"ReadCMD.project/{key}", lambda CMD=CMD, data=data, fields=fields: (
+            CMD.project(data, fields)
+        )
+    fc = MultiWii(transport=SimulatedFC(timeout=1.0))
+    for key, CMD in commands(Command.WriteCMD):
+        args = arguments(CMD)
+        cmd = CMD(*args)
+        data = cmd.toBytes()
+        yield f"WriteCMD.__init__/{key}", lambda CMD=CMD, args=args: CMD(*args)
+        yield f"WriteCMD.toBytes/{key}", cmd.toBytes
+        if args:
+            yield f"WriteCMD.update/{key}", lambda cmd=cmd, args=args: (
+                cmd.update(*args)
+            )
+        yield f"MultiWii.__emit__/{key}", lambda CMD=CMD, data=data: (
+            fc.__emit__(CMD.code, data)
+        )
+        yield f"Stream.frame.v1/{key}", lambda CMD=CMD, data=data: (
+            Stream.frame(CMD.code, data, 1)
+        )
+        yield f"Stream.frame.v2/{key}", lambda CMD=CMD, data=data: (
+            Stream.frame(CMD.code, data, 2)
+        )
+    for key, CMD in commands(Command.ReadCMD):
+        yield f"MultiWii.invoke/{key}", lambda cmd=CMD(): fc.invoke(cmd)
+    for key, CMD in commands(Command.WriteCMD):
+        cmd = CMD(*arguments(CMD))
+        yield f"MultiWii.invoke/{key}", lambda cmd=cmd: fc.invoke(cmd)
+    for key, CMD in commands(Command.WriteCMD, simple=True):
+        if not CMD.struct:
+            continue
+        sender, (field, dtype) = fc.sender(CMD), next(iter(CMD.struct.items()))
+        value = max(100, dtype.min)
+        yield f"FrameSender.send/{key}", lambda sender=sender, field=field, value=value: (
+            sender.__setitem__(field, value),
+            sender.send(),
+        )
+
+
+def measure(fn) -> dict:
+    fn()  # warm up caches and lazily created state
+    number = 1
+    while timeit(fn, number=number) < ROUND_TIME:
+        number *= 4
+    best = min(timeit(fn, number=number) for _ in range(REPEAT))
+    # Peak memory allocated while running a single call
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {"ops": number / best, "bytes": peak}
+
+
+def revision() -> str | None:
+    try:
+        cmd = ["git", "rev-parse", "--short", "HEAD"]
+        return subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(pattern: str = None) -> dict:
+    results = {}
+    print(f"{'case':<44} {'op/s':>14} {'peak bytes':>11}")
+    for name, fn in cases():
+        if pattern and pattern not in name:
+            continue
+        results[name] = result = measure(fn)
+        print(f"{name:<44} {result['ops']:>14,.0f} {result['bytes']:>11,}")
+    return results
+
+
+def compare(results: dict, baseline: dict) -> int:
+    regressions = 0
+    print()
+    print(f"{'case':<44} {'base op/s':>14} {'op/s':>14} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["ops"], result["ops"]
+        change = after / before - 1
+        flag = ""
+        if change < -THRESHOLD:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<44} {before:>14,.0f} {after:>14,.0f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+# -- Codec speedup over the original field-by-field implementation ----
+
+
+def legacy_fromBytes(cmd: Command.ReadCMD, buffer: bytes) -> dict:
+    # Field-by-field decoder used before precompiled codecs were introduced
+    result = {}
+    buffer = list(buffer)
+    for key, dtype in cmd.struct.items():
+        result[key] = dtype.fromBytes(buffer[: dtype.byte_size])
+        buffer = buffer[dtype.byte_size :]
+    return result
+
+
+def legacy_toBytes(cmd: Command.WriteCMD) -> bytes:
+    result = bytes()
+    for (_, dtype), val in zip(cmd.struct.items(), cmd.values):
+        result += dtype.toBytes(val)
+    return result
+
+
+def legacy(rounds: int = 20000):
+    def report(name: str, before: float, after: float):
+        print(
+            f"{name:<16} {rounds / before:>12,.0f} {rounds / after:>12,.0f} {before / after:>8.2f}x"
+        )
+
+    print(f"{'decode':<16} {'legacy op/s':>12} {'codec op/s':>12} {'speedup':>9}")
+    for key, CMD in commands(Command.ReadCMD, simple=True):
+        cmd, data = CMD(), bytes(range(CMD.size))
+        assert legacy_fromBytes(cmd, data) == cmd.fromBytes(data)
+        before = timeit(lambda: legacy_fromBytes(cmd, data), number=rounds)
+        after = timeit(lambda: cmd.fromBytes(data), number=rounds)
+        report(key, before, after)
+    print()
+    print(f"{'encode':<16} {'legacy op/s':>12} {'codec op/s':>12} {'speedup':>9}")
+    for key, CMD in commands(Command.WriteCMD, simple=True):
+        cmd = CMD(*arguments(CMD))
+        assert legacy_toBytes(cmd) == cmd.toBytes()
+        before = timeit(lambda: legacy_toBytes(cmd), number=rounds)
+        after = timeit(lambda: cmd.toBytes(), number=rounds)
+        report(key, before, after)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark encode / decode / framing hot paths"
+    )
+    parser.add_argument("-k", dest="pattern", help="only run matching cases")
+    parser.add_argument("--save", metavar="JSON", help="save results as baseline")
+    parser.add_argument("--compare", metavar="JSON", help="compare with baseline")
+    parser.add_argument("--legacy", action="store_true", help="codec speedup table")
+    args = parser.parse_args()
+    if args.legacy:
+        legacy()
+        sys.exit()
+    results = run(args.pattern)
+    if args.save:
+        with open(args.save, "w") as f:
+            meta = {
+                "revision": revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "time": time.time(),
+            }
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        sys.exit(1 if compare(results, baseline) else 0)
@@ -17,23 +17,18 @@ INDENT = "  "
 
 MSP_COMMANDS = {}
 
-for key in dir(MSP):
-    item = getattr(MSP, key)
-    try:
-        if issubclass(item, Command.MSP_Command):
-            MSP_COMMANDS[item.code] = {
-                "key": key,
-                "struct": item.struct,
-                "direction": "MSP_RECV" if issubclass(item, Command.ReadCMD) else "MSP_SEND"
-            }
-    except Exception:
-        pass
+for code, item in Command.COMMANDS.by_code.items():
+    MSP_COMMANDS[code] = {
+        "key": item.__name__,
+        "struct": item.struct,
+        "direction": "MSP_RECV" if issubclass(item, Command.ReadCMD) else "MSP_SEND"
+    }
 
 for code in sorted(MSP_COMMANDS.keys()):
     key = MSP_COMMANDS[code]["key"]
     struct = MSP_COMMANDS[code]["struct"]
     direction = MSP_COMMANDS[code]["direction"]
     name = "MSP_" + key
-    struct_content = [INDENT + f"{t.ctype()} {key};" for key, t in struct.items()]
+    struct_content = [INDENT + f"{t.cdecl(key)};" for key, t in struct.items()]
     print("\ntypedef struct " + name + "_s {", *struct_content, "} " + name + "_t;", sep='\n', end='\n\n')
     print(f"__{direction}__({key}, {code});")
@@ -0,0 +1,167 @@
+# ===================================================================
+# asyncio implementation of MultiWii Serial Protocol (MSP)
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# The link is driven by an asyncio transport (serial fd, pty or socket)
+# whose data_received callback is the single reader: every decoded
+# frame resolves the future of the in-flight request with the same
+# code. Concurrent reads of the same code share one request on the wire.
+# ===================================================================
+import asyncio, time
+from collections import deque
+from .Clock import SampleClock, Timing
+from .Command import ReadCMD, WriteCMD
+from .Response import Response
+from .Stream import PREAMBLE, DIRECTION, FrameParser, frame, pickVersion
+from .Timeout import FRAME_OVERHEAD
+from .Transport import open_serial
+
+# Unsolicited frames kept until read, the oldest are dropped beyond
+INBOX_SIZE = 256
+
+
+class AsyncMultiWii(asyncio.Protocol):
+    transport: asyncio.WriteTransport = None
+    # Every transport attached (the read and write pipes of a serial port)
+    transports: list[asyncio.BaseTransport]
+    # 1 (MSP v1), 2 (MSP v2) or None to auto-detect
+    protocol: int = None
+    # In-flight reads: code -> [shared future, number of waiting callers,
+    # query, time sent]
+    pending: dict[int, list]
+    # (code, payload) of received frames nobody was waiting for, in
+    # arrival order
+    inbox: deque[tuple[int, bytes]]
+    # Callbacks (direction, code, payload) invoked for every frame on the link
+    hooks: list
+    # Acquisition time of replies (see lib/Clock.py)
+    clock: SampleClock
+
+    def __init__(self, baud: int = None, protocol: int = None):
+        self.protocol = protocol
+        self.parser = FrameParser(PREAMBLE.RECV, protocol)
+        self.clock = SampleClock(baud)
+        self.parser.byte_time = self.clock.wire_time(1)
+        self.pending = {}
+        self.inbox = deque(maxlen=INBOX_SIZE)
+        self.hooks = []
+        self.transports = []
+        self.closed = asyncio.get_running_loop().create_future()
+
+    # -- Constructors ---------------------------------------------------
+
+    @classmethod
+    async def open(
+        cls, path: str = None, baud: int = 115200, protocol: int = None
+    ) -> "AsyncMultiWii":
+        # Serial device (or pty), read and written through pipe transports
+        port = open_serial(path, baud, timeout=0)
+        loop = asyncio.get_running_loop()
+        fc = cls(baud, protocol)
+        await loop.connect_write_pipe(lambda: fc, port)
+        await loop.connect_read_pipe(lambda: fc, port)
+        return fc
+
+    @classmethod
+    async def connect(
+        cls, host: str, port: int, protocol: int = None
+    ) -> "AsyncMultiWii":
+        # TCP stand-in for the serial link
+        loop = asyncio.get_running_loop()
+        _, fc = await loop.create_connection(lambda: cls(None, protocol), host, port)
+        return fc
+
+    @classmethod
+    async def connect_unix(cls, path: str, protocol: int = None) -> "AsyncMultiWii":
+        # Unix socket stand-in for the serial link
+        loop = asyncio.get_running_loop()
+        _, fc = await loop.create_unix_connection(lambda: cls(None, protocol), path)
+        return fc
+
+    def close(self):
+        for transport in self.transports:
+            if not transport.is_closing():
+                transport.close()
+
+    # -- asyncio.Protocol -----------------------------------------------
+
+    def connection_made(self, transport):
+        # Pipe transports report twice (write side first), keep the writer
+        self.transports.append(transport)
+        if self.transport is None:
+            self.transport = transport
+
+    def data_received(self, data: bytes):
+        self.parser.feed(data)
+        for code, payload in self.parser:
+            for hook in self.hooks:
+                hook(DIRECTION.RECV, code, payload)
+            entry = self.pending.pop(code, None)
+            if entry is not None and not entry[0].done():
+                size = FRAME_OVERHEAD + len(entry[2])
+                timing = self.clock.timing(entry[3], size, self.parser.stamp)
+                entry[0].set_result((payload, timing))
+            else:
+                self.inbox.append((code, payload))
+
+    def connection_lost(self, exc):
+        # Called once per transport: losing either pipe closes the link
+        self.close()
+        for future, *_ in self.pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError("MSP link closed"))
+        self.pending.clear()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    # -- Commands -------------------------------------------------------
+
+    def __send__(self, code: int, buffer: bytes = b""):
+        for hook in self.hooks:
+            hook(DIRECTION.SEND, code, buffer)
+        version = pickVersion(self.protocol, code, len(buffer), self.parser.version)
+        self.transport.write(frame(code, buffer, version))
+
+    async def __request__(self, code: int, query: bytes = b"") -> tuple[bytes, Timing]:
+        entry = self.pending.get(code)
+        while entry is not None and entry[2] != query:
+            # Replies only carry the code: a read of the same code with other
+            # arguments (e.g. another WP number) waits for its turn
+            await asyncio.wait([entry[0]])
+            entry = self.pending.get(code)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            entry = [future, 0, query, time.monotonic()]
+            self.pending[code] = entry
+            self.__send__(code, query)
+        entry[1] += 1
+        try:
+            # Shielded so that one cancelled caller does not cancel the
+            # request for everybody else sharing it
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # Last caller gave up: forget the request
+                entry[0].cancel()
+                if self.pending.get(code) is entry:
+                    del self.pending[code]
+
+    async def invoke(
+        self, command: ReadCMD | WriteCMD, timeout: float = 1.0, fields=None
+    ) -> Response | tuple | None:
+        if isinstance(command, ReadCMD):
+            request = self.__request__(command.code, command.query)
+            data, timing = await asyncio.wait_for(request, timeout)
+            if fields is not None:
+                return command.project(data, fields)
+            response = command.fromBytes(data, timing)
+            self.clock.update(response)
+            return response
+        elif isinstance(command, WriteCMD):
+            self.__send__(command.code, command.toBytes())
+        else:
+            raise TypeError
+        return None
@@ -0,0 +1,257 @@
+# ===================================================================
+# Shared memory board of the latest telemetry, for local processes
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   board = Publisher(fc, name="msp-fc0")   # process owning the link
+#   poller.start()                          # or any other reads
+#   ...
+#   reader = Reader("msp-fc0")              # any number of processes
+#   reader.read(MSP.ATTITUDE)               # -> Snapshot(time, value, seq)
+# The publisher hooks into the link: every reply of a board command is
+# copied, as received, into its slot of a multiprocessing.shared_memory
+# segment. Nothing is pickled or sent through pipes.
+# Layout (little-endian):
+#   header     magic, version, number of slots
+#   directory  (code, payload size, slot offset) per slot
+#   slots      sequence (u64) | arrival time (f64) | crc32 (u32) | payload,
+#              8-byte aligned
+# Slots are seqlocks: the writer makes the sequence odd, writes, then
+# makes it even again. A reader copies the slot and retries if the
+# sequence was odd or changed meanwhile, so it never blocks the writer.
+# The stores are plain memcpy without fences, so on CPUs with weaker
+# ordering than x86 a reader may see the new sequence before the data:
+# the crc32 of time and payload is checked too, a mismatch is a retry.
+# ===================================================================
+import mmap, os, time
+from multiprocessing.shared_memory import SharedMemory
+from struct import Struct
+from typing import NamedTuple
+from zlib import crc32
+from . import MSP
+from .Command import COMMANDS, ReadCMD
+from .Response import Response
+from .Stream import DIRECTION
+
+MAGIC = b"MSPB"
+VERSION = 2
+HEADER = Struct("<4sHH")
+ENTRY = Struct("<HHI")
+SEQUENCE = Struct("<Q")
+STAMP = Struct("<d")
+CHECK = Struct("<I")
+# Slot header: sequence, arrival time and checksum
+SLOT_HEADER = SEQUENCE.size + STAMP.size + CHECK.size
+# Default board content
+TELEMETRY = (
+    MSP.STATUS,
+    MSP.RAW_IMU,
+    MSP.SERVO,
+    MSP.MOTOR,
+    MSP.RC,
+    MSP.RAW_GPS,
+    MSP.COMP_GPS,
+    MSP.ATTITUDE,
+    MSP.ALTITUDE,
+    MSP.ANALOG,
+)
+# Seconds a reader waits for a slot held by the writer before giving up
+# (the publisher died in the middle of a write)
+STALL_TIMEOUT = 0.5
+
+
+class Snapshot(NamedTuple):
+    # Host time (time.monotonic, shared by local processes) the reply arrived
+    time: float
+    value: Response
+    # Number of updates of the slot so far
+    seq: int
+
+
+def layout(commands) -> tuple[int, dict[int, tuple[int, int]]]:
+    # Segment size and code -> (slot offset, payload size)
+    offset = HEADER.size + ENTRY.size * len(commands)
+    offset = (offset + 7) & ~7
+    slots = {}
+    for CMD in commands:
+        assert CMD.tail is None, f"{CMD.__name__} has no fixed payload size"
+        slots[CMD.code] = (offset, CMD.size)
+        offset += (SLOT_HEADER + CMD.size + 7) & ~7
+    return offset, slots
+
+
+def checksum(stamp: float, payload) -> int:
+    return crc32(payload, crc32(STAMP.pack(stamp)))
+
+
+class Segment:
+    """
+    Existing POSIX shared memory segment, mapped read-only. Before Python
+    3.13 SharedMemory registers every segment it opens with the resource
+    tracker, which unlinks it when the process exits. Unregistering
+    afterwards is no better, since processes forked from the publisher
+    share its tracker, so the segment is mapped directly instead.
+    """
+
+    def __init__(self, name: str):
+        import _posixshmem
+
+        fd = _posixshmem.shm_open("/" + name, os.O_RDONLY, mode=0o600)
+        try:
+            self.mmap = mmap.mmap(fd, os.fstat(fd).st_size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        self.name = name
+        self.buf = memoryview(self.mmap)
+
+    def close(self):
+        self.buf.release()
+        self.mmap.close()
+
+
+def attach(name: str) -> SharedMemory | Segment:
+    # Map an existing segment without taking ownership of it
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    if os.name == "nt":
+        # Not tracked on Windows
+        return SharedMemory(name)
+    return Segment(name)
+
+
+class Publisher:
+    shm: SharedMemory
+    # code -> (slot offset, payload size)
+    slots: dict[int, tuple[int, int]]
+    # code -> current sequence, the publisher is the only writer
+    sequences: dict[int, int]
+
+    def __init__(
+        self, fc, commands: tuple[type[ReadCMD], ...] = TELEMETRY, name: str = None
+    ):
+        # fc: MultiWii or AsyncMultiWii, replies are taken from its hooks
+        total, self.slots = layout(commands)
+        self.shm = SharedMemory(name, create=True, size=total)
+        buffer = self.shm.buf
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, len(self.slots))
+        for index, (code, (offset, size)) in enumerate(self.slots.items()):
+            ENTRY.pack_into(
+                buffer, HEADER.size + index * ENTRY.size, code, size, offset
+            )
+        self.sequences = dict.fromkeys(self.slots, 0)
+        self.fc = fc
+        fc.hooks.append(self.__hook__)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __hook__(self, direction: int, code: int, payload: bytes):
+        if direction == DIRECTION.RECV and code in self.slots:
+            self.write(code, payload, self.fc.parser.stamp)
+
+    def write(self, code: int, payload: bytes, stamp: float = None):
+        offset, size = self.slots[code]
+        if len(payload) != size:
+            # Not the layout the readers expect, keep the previous value
+            return
+        buffer = self.shm.buf
+        sequence = self.sequences[code] + 1
+        stamp = stamp or time.monotonic()
+        SEQUENCE.pack_into(buffer, offset, sequence)
+        STAMP.pack_into(buffer, offset + SEQUENCE.size, stamp)
+        CHECK.pack_into(
+            buffer, offset + SLOT_HEADER - CHECK.size, checksum(stamp, payload)
+        )
+        buffer[offset + SLOT_HEADER : offset + SLOT_HEADER + size] = payload
+        SEQUENCE.pack_into(buffer, offset, sequence + 1)
+        self.sequences[code] = sequence + 1
+
+    def close(self):
+        # Stop publishing and remove the segment (readers keep their mapping)
+        if self.__hook__ in self.fc.hooks:
+            self.fc.hooks.remove(self.__hook__)
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class Reader:
+    shm: SharedMemory | Segment
+    # code -> (slot offset, payload size), as published
+    slots: dict[int, tuple[int, int]]
+
+    def __init__(self, name: str):
+        self.shm = attach(name)
+        buffer = self.shm.buf
+        magic, version, count = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f"{name} is not an MSP telemetry board")
+        self.slots = {}
+        for index in range(count):
+            code, size, offset = ENTRY.unpack_from(
+                buffer, HEADER.size + index * ENTRY.size
+            )
+            self.slots[code] = (offset, size)
+
+    @property
+    def commands(self) -> list[type[ReadCMD]]:
+        return [COMMANDS[code] for code in self.slots if code in COMMANDS]
+
+    def seq(self, CMD: type[ReadCMD]) -> int:
+        # Sequence of a slot, cheap polling for changes (odd: being written)
+        return SEQUENCE.unpack_from(self.shm.buf, self.slots[CMD.code][0])[0]
+
+    def read(self, CMD: type[ReadCMD]) -> Snapshot | None:
+        # Consistent copy of the latest value, None if never published
+        offset, size = self.slots[CMD.code]
+        buffer, start = self.shm.buf, offset + SLOT_HEADER
+        deadline = None
+        while True:
+            (before,) = SEQUENCE.unpack_from(buffer, offset)
+            if before == 0:
+                return None
+            if not before & 1:
+                (stamp,) = STAMP.unpack_from(buffer, offset + SEQUENCE.size)
+                (check,) = CHECK.unpack_from(buffer, start - CHECK.size)
+                payload = bytes(buffer[start : start + size])
+                if (
+                    SEQUENCE.unpack_from(buffer, offset)[0] == before
+                    and checksum(stamp, payload) == check
+                ):
+                    return Snapshot(stamp, CMD.Response(payload), before >> 1)
+            # Torn read, let the writer finish
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + STALL_TIMEOUT
+            elif now > deadline:
+                raise TimeoutError(f"{CMD.__name__} slot held by the writer")
+            time.sleep(0)
+
+    def snapshot(self) -> dict[type[ReadCMD], Snapshot]:
+        # Latest value of every published command
+        result = {}
+        for CMD in self.commands:
+            value = self.read(CMD)
+            if value is not None:
+                result[CMD] = value
+        return result
+
+    def close(self):
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,202 @@
+# ===================================================================
+# MSP bridge: one flight controller link shared by many socket clients
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   python -m lib.Bridge /dev/ttyACM0 --tcp 5760 --unix /tmp/msp.sock
+#   fc = MultiWii("tcp://127.0.0.1:5760")     # in any number of processes
+# Clients speak raw MSP (v1 or v2) over TCP or Unix sockets, exactly as
+# they would over the serial port. The link is driven by a MultiWii on a
+# single worker thread:
+#   - a read is answered to the client that sent it, in its MSP version;
+#     clients asking for the same code (and arguments) while a request is
+#     pending share its reply instead of sending another one
+#   - a write is forwarded and acknowledged with an empty frame, like the
+#     firmware does
+#   - every client has a token bucket rate limit; requests above it are
+#     delayed (not dropped) so one greedy client cannot starve the others;
+#     copies of a request still queued for the client are not forwarded
+#     again, each of them is answered with the same reply
+#   - a client is disconnected if the link to the controller fails
+# ===================================================================
+import argparse, asyncio, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .Command import COMMANDS, WriteCMD
+from .MultiWii import MultiWii, RequestTimeout
+from .Stream import PREAMBLE, DIRECTION, FrameParser, frame, pickVersion
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+    def delay(self) -> float:
+        # Take one token, returns how long to wait before using it
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Client(asyncio.Protocol):
+    transport: asyncio.Transport = None
+    # Counters
+    requests: int
+    throttled: int
+
+    def __init__(self, bridge: "Bridge"):
+        self.bridge = bridge
+        self.parser = FrameParser(PREAMBLE.SEND)
+        self.queue = asyncio.Queue()
+        # (code, payload) of the frames in the queue -> number of copies
+        self.queued = Counter()
+        self.bucket = TokenBucket(bridge.rate, bridge.burst) if bridge.rate else None
+        self.requests = 0
+        self.throttled = 0
+        self.task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.bridge.clients.add(self)
+        # Frames of one client are served in order
+        self.task = asyncio.get_running_loop().create_task(self.__serve__())
+
+    def data_received(self, data: bytes):
+        self.parser.feed(data)
+        for code, payload in self.parser:
+            key = (code, payload)
+            self.queued[key] += 1
+            if self.queued[key] > 1:
+                # Pipelined or retried while waiting, answered by the pending reply
+                continue
+            self.queue.put_nowait((code, payload, self.parser.version))
+
+    def connection_lost(self, exc):
+        self.bridge.clients.discard(self)
+        if self.task is not None:
+            self.task.cancel()
+
+    async def __serve__(self):
+        while True:
+            code, payload, version = await self.queue.get()
+            self.requests += 1
+            if self.bucket is not None:
+                delay = self.bucket.delay()
+                if delay:
+                    self.throttled += 1
+                    await asyncio.sleep(delay)
+            try:
+                reply = await self.bridge.handle(code, payload)
+            except OSError:
+                # Link to the controller lost, let the client notice
+                self.transport.close()
+                return
+            finally:
+                copies = self.queued.pop((code, payload), 1)
+            if reply is None or self.transport.is_closing():
+                continue
+            version = pickVersion(None, code, len(reply), version)
+            self.transport.write(frame(code, reply, version, DIRECTION.RECV) * copies)
+
+
+class Bridge:
+    # Pending reads: (code, arguments) -> future of the reply payload
+    inflight: dict[tuple[int, bytes], asyncio.Future]
+    clients: set[Client]
+    # Counters
+    requests: int
+    shared: int
+
+    def __init__(self, fc: MultiWii, rate: float = None, burst: int = 10):
+        # rate: requests per second allowed to each client (None: unlimited)
+        self.fc = fc
+        self.rate = rate
+        self.burst = burst
+        self.inflight = {}
+        self.clients = set()
+        self.requests = 0
+        self.shared = 0
+        # The link is only ever touched by this thread
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="msp-bridge")
+
+    async def handle(self, code: int, payload: bytes) -> bytes | None:
+        # Reply payload for the client, None if the controller did not answer
+        loop = asyncio.get_running_loop()
+        CMD = COMMANDS.get(code)
+        if CMD is not None and issubclass(CMD, WriteCMD):
+            await loop.run_in_executor(self.executor, self.__write__, CMD, payload)
+            return b""
+        key = (code, payload)
+        future = self.inflight.get(key)
+        if future is None:
+            self.requests += 1
+            future = loop.run_in_executor(self.executor, self.fc.request, code, payload)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.__done__(key, future))
+        else:
+            self.shared += 1
+        try:
+            # Shielded: a client disconnecting does not cancel the others
+            return await asyncio.shield(future)
+        except RequestTimeout:
+            return None
+
+    def __write__(self, CMD: type[WriteCMD], payload: bytes):
+        self.fc.__send__(CMD.code, payload)
+        self.fc.__written__(CMD)
+
+    def __done__(self, key: tuple, future: asyncio.Future):
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+
+    async def serve(self, tcp: tuple[str, int] = None, unix: str = None) -> list:
+        loop = asyncio.get_running_loop()
+        servers = []
+        if tcp is not None:
+            servers.append(await loop.create_server(lambda: Client(self), *tcp))
+        if unix is not None:
+            servers.append(await loop.create_unix_server(lambda: Client(self), unix))
+        return servers
+
+    async def serve_forever(self, tcp: tuple[str, int] = None, unix: str = None):
+        servers = await self.serve(tcp, unix)
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share one MSP link over sockets")
+    parser.add_argument("device", nargs="?", help="serial device (default: discover)")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--host", default="127.0.0.1", help="TCP listen address")
+    parser.add_argument("--tcp", type=int, metavar="PORT", help="TCP listen port")
+    parser.add_argument("--unix", metavar="PATH", help="Unix socket path")
+    parser.add_argument("--rate", type=float, help="requests/s per client")
+    parser.add_argument("--burst", type=int, default=10, help="rate limit burst")
+    parser.add_argument("--simulate", action="store_true", help="use SimulatedFC")
+    args = parser.parse_args()
+    if args.tcp is None and args.unix is None:
+        parser.error("nothing to serve, pass --tcp and/or --unix")
+    if args.simulate:
+        from .Simulator import SimulatedFC
+
+        fc = MultiWii(transport=SimulatedFC())
+    else:
+        fc = MultiWii(args.device, args.baud)
+    bridge = Bridge(fc, args.rate, args.burst)
+    tcp = None if args.tcp is None else (args.host, args.tcp)
+    try:
+        asyncio.run(bridge.serve_forever(tcp, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.close()
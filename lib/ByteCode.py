@@ -4,12 +4,53 @@
 # Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
 # Published under MIT License
 # ===================================================================
+from collections import OrderedDict, namedtuple
+from struct import Struct, unpack_from
+
 ENDIAN = "little"
+# Byte order prefix for struct.Struct formats (no alignment padding)
+STRUCT_ENDIAN = "<"
 
 
 class TypedInteger(int):
+    # Plain int subclass, the encoded bytes are only computed on demand
+    __slots__ = ()
     byte_size: int
     signed: bool
+    # Accepted values, the whole integer type unless narrowed by within()
+    min: int
+    max: int
+    # Value of a field left unset: 0, or the range bound closest to it
+    default = 0
+    # Scalars always have a fixed size and occupy one struct value
+    fixed = True
+    width = 1
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "byte_size" in cls.__dict__:
+            bits = cls.byte_size * 8
+            cls.min = -(1 << (bits - 1)) if cls.signed else 0
+            cls.max = (1 << (bits - 1 if cls.signed else bits)) - 1
+
+    @classmethod
+    def within(cls, min: int, max: int) -> type["TypedInteger"]:
+        # Same wire type restricted to a documented range, e.g. U16.within(1000, 2000)
+        assert cls.min <= min <= max <= cls.max, f"range exceeds {cls.__name__}"
+        name = f"{cls.__name__}[{min};{max}]"
+        default = max if max < 0 else min if min > 0 else 0
+        namespace = {"__slots__": (), "min": min, "max": max, "default": default}
+        return type(name, (cls,), namespace)
+
+    @classmethod
+    def check(cls, value: int) -> int:
+        # Validated plain int, raises ValueError outside [min;max]
+        value = int(value)
+        if not cls.min <= value <= cls.max:
+            raise ValueError(
+                f"{value} out of range [{cls.min};{cls.max}] for {cls.__name__}"
+            )
+        return value
 
     @classmethod
     def ctype(cls) -> str:
@@ -18,6 +59,16 @@ class TypedInteger(int):
         else:
             return f"uint{cls.byte_size * 8}_t"
 
+    @classmethod
+    def cdecl(cls, name: str) -> str:
+        return f"{cls.ctype()} {name}"
+
+    @classmethod
+    def fmt(cls) -> str:
+        # Format character understood by the struct module
+        code = {1: "b", 2: "h", 4: "i", 8: "q"}[cls.byte_size]
+        return code if cls.signed else code.upper()
+
     @classmethod
     def toBytes(cls, value: int) -> bytes:
         return value.to_bytes(cls.byte_size, ENDIAN, signed=cls.signed)
@@ -38,52 +89,202 @@ class TypedInteger(int):
 
     def __new__(cls, value: int | bytes):
         if isinstance(value, int) or isinstance(value, float):
-            return super().__new__(cls, value)
+            return super().__new__(cls, cls.check(value))
         elif isinstance(value, bytes):
             return super().__new__(cls, cls.fromBytes(value))
         else:
             raise TypeError
 
-    def __init__(self, value: int):
-        self.value = value
-        self.bytes = self.toBytes(value)
+    @property
+    def value(self) -> int:
+        return int(self)
+
+    @property
+    def bytes(self):
+        return self.toBytes(self)
 
 
 class U8(TypedInteger):
+    __slots__ = ()
     byte_size = 1
     signed = False
 
 
 class U16(TypedInteger):
+    __slots__ = ()
     byte_size = 2
     signed = False
 
 
 class U32(TypedInteger):
+    __slots__ = ()
     byte_size = 4
     signed = False
 
 
 class U64(TypedInteger):
+    __slots__ = ()
     byte_size = 8
     signed = False
 
 
 class I8(TypedInteger):
+    __slots__ = ()
     byte_size = 1
     signed = True
 
 
 class I16(TypedInteger):
+    __slots__ = ()
     byte_size = 2
     signed = True
 
 
 class I32(TypedInteger):
+    __slots__ = ()
     byte_size = 4
     signed = True
 
 
 class I64(TypedInteger):
+    __slots__ = ()
     byte_size = 8
     signed = True
+
+
+# ===================================================================
+# Compound payload fields
+# ===================================================================
+
+
+def isScalar(dtype) -> bool:
+    return isinstance(dtype, type) and issubclass(dtype, TypedInteger)
+
+
+class Record:
+    """
+    Group of integer fields with a fixed layout, decoded as a named tuple.
+    e.g. Record("ServoConf", min=U16, max=U16, middle=U16, rate=U8)
+    """
+
+    fixed = True
+
+    def __init__(self, name: str, **fields: type[TypedInteger]):
+        self.name = name
+        self.fields = OrderedDict(fields)
+        self.type = namedtuple(name, self.fields.keys())
+        self.codec = Struct(STRUCT_ENDIAN + self.fmt())
+        self.byte_size = self.codec.size
+        self.width = len(self.fields)
+
+    def ctype(self) -> str:
+        members = " ".join(f"{t.ctype()} {k};" for k, t in self.fields.items())
+        return f"struct {{ {members} }}"
+
+    def cdecl(self, name: str) -> str:
+        return f"{self.ctype()} {name}"
+
+    def fmt(self) -> str:
+        return "".join(t.fmt() for t in self.fields.values())
+
+    def __call__(self, value=None):
+        if value is None:
+            return self.type(*(t.default for t in self.fields.values()))
+        if isinstance(value, dict):
+            value = (value.get(k, t.default) for k, t in self.fields.items())
+        dtypes = self.fields.values()
+        return self.type(*(t.check(v) for t, v in zip(dtypes, value, strict=True)))
+
+    def fromValues(self, values: tuple):
+        return self.type._make(values)
+
+    def toValues(self, value) -> tuple:
+        return tuple(value)
+
+
+class Repeated:
+    """
+    Array of scalars or records. With count=None the number of items is
+    derived from the payload size, which is only allowed for the last
+    field of a command.
+    Decoded in bulk into a list (of named tuples for records).
+    """
+
+    def __init__(self, item: type[TypedInteger] | Record, count: int = None):
+        self.item = item
+        self.count = count
+        self.fixed = count is not None
+        self.width = item.width * (count or 0)
+        self.byte_size = item.byte_size * (count or 0)
+
+    def ctype(self) -> str:
+        return self.item.ctype()
+
+    def cdecl(self, name: str) -> str:
+        # Variable length arrays become (GNU) zero-length trailing arrays
+        return f"{self.item.cdecl(name)}[{self.count or 0}]"
+
+    def fmt(self) -> str:
+        assert self.fixed, "variable length fields have no static format"
+        return self.item.fmt() * self.count
+
+    def __call__(self, value=None) -> list:
+        if value is None:
+            item = self.item.default if isScalar(self.item) else self.item()
+            return [item] * (self.count or 0)
+        if isScalar(self.item):
+            return list(map(self.item.check, value))
+        return [self.item(v) for v in value]
+
+    def fromValues(self, values: tuple) -> list:
+        if isScalar(self.item):
+            return list(values)
+        step = self.item.width
+        make = self.item.type._make
+        return [make(values[i : i + step]) for i in range(0, len(values), step)]
+
+    def toValues(self, value: list):
+        if isScalar(self.item):
+            return value
+        return [x for record in value for x in record]
+
+    def decode(self, buffer: bytes) -> list:
+        count, excess = divmod(len(buffer), self.item.byte_size)
+        assert excess == 0, f"misaligned buffer for {self.item.ctype()}[]"
+        if isScalar(self.item):
+            return list(unpack_from(f"{STRUCT_ENDIAN}{count}{self.item.fmt()}", buffer))
+        return list(map(self.item.type._make, self.item.codec.iter_unpack(buffer)))
+
+    def encode(self, value: list) -> bytes:
+        count = len(value)
+        values = self.toValues(value)
+        return Struct(f"{STRUCT_ENDIAN}{self.item.fmt() * count}").pack(*values)
+
+
+class String:
+    """
+    ASCII list of items, each terminated by a separator (e.g. "ARM;ANGLE;")
+    """
+
+    fixed = False
+
+    def __init__(self, separator: str = ";"):
+        self.separator = separator
+
+    def ctype(self) -> str:
+        return "char"
+
+    def cdecl(self, name: str) -> str:
+        return f"char {name}[0]"
+
+    def __call__(self, value=None) -> list[str]:
+        return [] if value is None else list(value)
+
+    def decode(self, buffer: bytes) -> list[str]:
+        items = bytes(buffer).decode("ascii").split(self.separator)
+        if items and items[-1] == "":
+            items.pop()
+        return items
+
+    def encode(self, value: list[str]) -> bytes:
+        return "".join(item + self.separator for item in value).encode("ascii")
@@ -0,0 +1,99 @@
+# ===================================================================
+# Response cache for rarely changing configuration reads
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   fc.cache = ResponseCache({MSP.IDENT: STATIC, MSP.PID: STATIC, MSP.MISC: 5.0})
+#   fc.invoke(MSP.PID())           # round-trip once, then served locally
+#   fc.invoke(MSP.SET_PID(...))    # drops the cached PID reply
+#   fc.refresh(MSP.PID())          # explicit round-trip, updates the cache
+# A policy is a time to live in seconds, or STATIC to keep the reply until
+# a write command invalidates it: SET_X invalidates X, while RESET_CONF and
+# EEPROM_WRITE invalidate every entry. Only commands listed in the policy
+# are cached, replies are stored as raw payloads.
+# ===================================================================
+import time
+from . import MSP
+from .Command import COMMANDS, ReadCMD, WriteCMD, mirror
+
+# Policy of entries only dropped by invalidation
+STATIC = None
+# Writes that may change any configuration value
+INVALIDATE_ALL = (MSP.RESET_CONF.code, MSP.EEPROM_WRITE.code)
+
+
+class CacheStats:
+    hits: int
+    misses: int
+    # Entries dropped by write commands (or invalidate())
+    invalidations: int
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self):
+        return (
+            f"CacheStats(hits={self.hits}, misses={self.misses}, "
+            f"ratio={self.ratio:.1%}, invalidations={self.invalidations})"
+        )
+
+
+class ResponseCache:
+    # Read code -> time to live in seconds, or STATIC
+    policy: dict[int, float | None]
+    # (code, query) -> (expiry time or None, payload)
+    entries: dict[tuple[int, bytes], tuple[float | None, bytes]]
+    # Write code -> read code whose entries it invalidates
+    targets: dict[int, int]
+    stats: CacheStats
+
+    def __init__(self, policy: dict[type[ReadCMD], float | None]):
+        self.policy = {CMD.code: ttl for CMD, ttl in policy.items()}
+        self.entries = {}
+        reads = {CMD.code: CMD for CMD in COMMANDS.reads()}
+        writes = {CMD.code: CMD for CMD in COMMANDS.writes()}
+        self.targets = mirror(writes, reads)
+        self.stats = CacheStats()
+
+    def __contains__(self, CMD: type[ReadCMD]) -> bool:
+        return CMD.code in self.policy
+
+    def get(self, command: ReadCMD) -> bytes | None:
+        # Cached payload of a fresh entry, None on a miss
+        entry = self.entries.get((command.code, command.query))
+        if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+            self.stats.hits += 1
+            return entry[1]
+        self.stats.misses += 1
+        return None
+
+    def put(self, command: ReadCMD, payload: bytes):
+        ttl = self.policy[command.code]
+        expiry = None if ttl is STATIC else time.monotonic() + ttl
+        self.entries[(command.code, command.query)] = (expiry, bytes(payload))
+
+    def invalidate(self, CMD: type[ReadCMD] = None):
+        # Drop every entry of CMD (e.g. all WP numbers), or everything
+        if CMD is None:
+            keys = list(self.entries)
+        else:
+            keys = [key for key in self.entries if key[0] == CMD.code]
+        for key in keys:
+            del self.entries[key]
+        self.stats.invalidations += len(keys)
+
+    def written(self, command: WriteCMD):
+        # Called for every write command going through the link
+        if command.code in INVALIDATE_ALL:
+            self.invalidate()
+        elif command.code in self.targets:
+            self.invalidate(COMMANDS[self.targets[command.code]])
@@ -0,0 +1,208 @@
+# ===================================================================
+# Parallel offline decoder for raw serial captures
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Requires numpy (optional dependency of this package).
+# Usage:
+#   python -m lib.Capture capture.bin -o capture.npz -j 8
+#   frames, errors = decode("capture.bin", jobs=8)
+#   frames["recv/RC"]["THROTTLE"]       # one column per field
+#   frames["recv/RC"]["offset"]         # byte offset of each frame
+# The capture is memory-mapped and split into chunks starting on a
+# preamble ($M< $M> $X< $X>). Preambles are located with vectorized
+# NumPy comparisons, and every chunk is walked by a separate process.
+# A chunk decodes the frame that straddles its end, the next chunk drops
+# whatever it found before that frame ended (see merge()).
+# Fixed-size payloads of known commands become structured arrays with
+# the wire layout of the command class, everything else is kept raw as
+# concatenated payload bytes plus per-frame sizes.
+# ===================================================================
+import argparse, mmap, os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import MSP  # defining the commands fills the registry
+from .Command import COMMANDS
+from .Recorder import payload_dtype
+from .Stream import DIRECTION, START, V2_HEADER, VERSIONS, crc8, xor8
+
+DIRECTIONS = {DIRECTION.SEND: "send", DIRECTION.RECV: "recv"}
+OFFSET_FIELD = "offset"
+# Default chunk size handed to one worker
+CHUNK_SIZE = 64 << 20
+
+
+def preambles(data: np.ndarray) -> np.ndarray:
+    # Offsets of every MSP v1 / v2 preamble in both directions
+    if len(data) < 3:
+        return np.empty(0, dtype=np.int64)
+    first, second, third = data[:-2], data[1:-1], data[2:]
+    match = first == START
+    match &= np.isin(second, list(VERSIONS))
+    match &= np.isin(third, list(DIRECTIONS))
+    return np.flatnonzero(match)
+
+
+def boundaries(data: np.ndarray, chunk_size: int) -> list[tuple[int, int]]:
+    # (start, end) chunks, every start but the first moved to a preamble
+    size, starts = len(data), [0]
+    for nominal in range(chunk_size, size, chunk_size):
+        window = nominal
+        while window < size:
+            # Grow the search window until a preamble shows up
+            found = preambles(data[window : window + 4096 + 2])
+            if len(found):
+                starts.append(window + int(found[0]))
+                break
+            window += 4096
+    starts = sorted(set(starts))
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def scan(data, start: int, end: int):
+    """
+    Frames starting in [start, end) as (offset, direction, code, payload
+    offset, size), the end of the last frame, and the offsets of preambles
+    that failed the checksum.
+    """
+    frames, errors, stop = [], [], start
+    size = len(data)
+    window = np.frombuffer(data, np.uint8, min(end + 2, size) - start, start)
+    for offset in preambles(window).tolist():
+        offset += start
+        if offset < stop:
+            # Inside the previous frame
+            continue
+        if data[offset + 1] == ord("M"):
+            if offset + 5 > size:
+                break
+            length, code = data[offset + 3], data[offset + 4]
+            payload = offset + 5
+            tail = payload + length
+            valid = tail < size and xor8(data[offset + 3 : tail + 1]) == 0
+        else:
+            payload = offset + 3 + V2_HEADER.size
+            if payload > size:
+                break
+            _, code, length = V2_HEADER.unpack_from(data, offset + 3)
+            tail = payload + length
+            valid = tail < size and crc8(data[offset + 3 : tail]) == data[tail]
+        if not valid:
+            errors.append(offset)
+            continue
+        frames.append((offset, data[offset + 2], code, payload, length))
+        stop = tail + 1
+    del window
+    return frames, stop, errors
+
+
+def columns(data, frames: list) -> dict[str, np.ndarray]:
+    # Columnar arrays of the frames of one (direction, code) pair
+    offsets = np.array([f[0] for f in frames], dtype=np.uint64)
+    sizes = np.array([f[4] for f in frames], dtype=np.uint32)
+    CMD = COMMANDS.get(frames[0][2])
+    if CMD is not None and CMD.tail is None and CMD.size and (sizes == CMD.size).all():
+        joined = b"".join(data[f[3] : f[3] + f[4]] for f in frames)
+        values = np.frombuffer(joined, payload_dtype(CMD))
+        result = {OFFSET_FIELD: offsets}
+        result.update((name, values[name]) for name in values.dtype.names)
+        return result
+    payloads = np.frombuffer(
+        b"".join(data[f[3] : f[3] + f[4]] for f in frames), np.uint8
+    )
+    return {OFFSET_FIELD: offsets, "size": sizes, "payload": payloads}
+
+
+def name(direction: int, code: int) -> str:
+    CMD = COMMANDS.get(code)
+    command = CMD.__name__ if CMD is not None else str(code)
+    return f"{DIRECTIONS[direction]}/{command}"
+
+
+def decode_chunk(path: str, start: int, end: int) -> tuple[dict, int, np.ndarray]:
+    # Worker: (columns of each command, end of the last frame, offsets of
+    # checksum errors)
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        frames, stop, errors = scan(data, start, end)
+        groups = {}
+        for frame in frames:
+            groups.setdefault((frame[1], frame[2]), []).append(frame)
+        result = {name(*key): columns(data, group) for key, group in groups.items()}
+        return result, stop, np.array(errors, dtype=np.uint64)
+    finally:
+        data.close()
+
+
+def drop(table: dict[str, np.ndarray], count: int) -> dict[str, np.ndarray]:
+    # Remove the first count frames of a table
+    result = {k: v[count:] for k, v in table.items()}
+    if "payload" in table:
+        # Raw payloads are concatenated, skip the bytes of dropped frames
+        result["payload"] = table["payload"][int(table["size"][:count].sum()) :]
+    return result
+
+
+def merge(chunks: list[tuple[dict, int, np.ndarray]]) -> tuple[dict, int]:
+    # Concatenate chunk results in file order, dropping frames (and errors)
+    # a chunk found inside the last frame of the previous one
+    tables, errors, stop = {}, 0, 0
+    for result, end, chunk_errors in chunks:
+        errors += len(chunk_errors) - int(np.searchsorted(chunk_errors, stop))
+        for key, table in result.items():
+            count = int(np.searchsorted(table[OFFSET_FIELD], stop))
+            if count:
+                table = drop(table, count)
+            tables.setdefault(key, []).append(table)
+        stop = max(stop, end)
+    merged = {}
+    for key, parts in tables.items():
+        merged[key] = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    return merged, errors
+
+
+def decode(
+    path: str, jobs: int = None, chunk_size: int = CHUNK_SIZE
+) -> tuple[dict, int]:
+    """
+    Decode a raw capture into {"<direction>/<command>": {column: array}},
+    also returns the number of checksum errors.
+    Work is spread over `jobs` processes (default: one per core).
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}, 0
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        chunks = boundaries(np.frombuffer(data, np.uint8), chunk_size)
+    finally:
+        data.close()
+    starts, ends = zip(*chunks)
+    if len(chunks) == 1 or jobs == 1:
+        results = list(map(decode_chunk, [path] * len(chunks), starts, ends))
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(decode_chunk, [path] * len(chunks), starts, ends))
+    return merge(results)
+
+
+def save(tables: dict, path: str):
+    # One .npz entry per column, named "<direction>/<command>/<column>"
+    np.savez(path, **{f"{k}/{c}": v for k, t in tables.items() for c, v in t.items()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode a raw MSP capture")
+    parser.add_argument("capture", help="raw byte capture of the serial link")
+    parser.add_argument("-o", dest="output", help="output .npz (default: capture.npz)")
+    parser.add_argument("-j", dest="jobs", type=int, help="worker processes")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE >> 20, help="chunk MiB")
+    args = parser.parse_args()
+    tables, errors = decode(args.capture, args.jobs, args.chunk << 20)
+    output = args.output or os.path.splitext(args.capture)[0] + ".npz"
+    save(tables, output)
+    for key, table in sorted(tables.items()):
+        print(f"{key:<24} {len(table[OFFSET_FIELD]):>12,} frames")
+    print(f"{errors:,} checksum errors, written to {output}")
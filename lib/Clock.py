@@ -0,0 +1,101 @@
+# ===================================================================
+# Acquisition time of telemetry samples on the host clock
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   attitude = fc.invoke(MSP.ATTITUDE())
+#   attitude.timing.received   # host time the first reply byte arrived
+#   attitude.timing.acquired   # estimated time the FC took the sample
+#   attitude.timing.error      # half-width of the interval it lies in
+# All times are time.monotonic() seconds. The FC exposes no clock of its
+# own, so its timeline is aligned to the host from request / reply timing:
+#   - the request reaches the FC its wire time plus a one-way latency L
+#     after it was written, and the reply takes L back to the host
+#   - L is half of the smallest round-trip residual (round-trip minus the
+#     request wire time) seen over the last WINDOW requests, as in NTP
+#   - replies carry values of the last completed loop iteration, which is
+#     up to one cycleTime (from STATUS) older than the reply
+# The reply was thus produced in [sent + wire + L, received - L], and the
+# sample up to one cycle earlier. The estimate is the middle of that
+# interval, the error bound its half-width.
+# ===================================================================
+from collections import deque
+from . import MSP
+from .Timeout import wire_time
+
+# Requests remembered by the minimum latency filter
+WINDOW = 64
+# Loop time assumed until a STATUS reply was seen, in seconds
+DEFAULT_CYCLE = 0.005
+
+
+class Timing:
+    __slots__ = ("sent", "received", "acquired", "error")
+    # Host time the request was written
+    sent: float | None
+    # Host time the first byte of the reply arrived
+    received: float
+    # Estimated acquisition time on the FC and its error bound (seconds)
+    acquired: float
+    error: float
+
+    def __init__(self, sent: float, received: float, acquired: float, error: float):
+        self.sent = sent
+        self.received = received
+        self.acquired = acquired
+        self.error = error
+
+    def __repr__(self):
+        return (
+            f"Timing(received={self.received:.6f}, acquired={self.acquired:.6f}"
+            f" ± {self.error * 1e3:.2f}ms)"
+        )
+
+
+class SampleClock:
+    # FC loop time in seconds
+    cycle: float
+    # One-way link latency in seconds, None before the first sample
+    latency: float | None
+
+    def __init__(self, baudrate: int = None, window: int = WINDOW):
+        self.baudrate = baudrate
+        self.cycle = DEFAULT_CYCLE
+        self.latency = None
+        self.residuals = deque(maxlen=window)
+
+    def wire_time(self, size: int) -> float:
+        return wire_time(size, self.baudrate)
+
+    def timing(
+        self, sent: float, size: int, received: float, sample: bool = True
+    ) -> Timing:
+        """
+        Timing of a reply whose request of `size` bytes (framing included)
+        was written at `sent`. Replies that could have waited behind other
+        traffic (retries, batches) should not be sampled.
+        """
+        arrival = sent + self.wire_time(size)
+        if sample:
+            self.residuals.append(received - arrival)
+            self.latency = max(0.0, min(self.residuals) / 2)
+        latency = self.latency or 0.0
+        earliest = arrival + latency - self.cycle
+        latest = max(arrival + latency, received - latency)
+        return Timing(sent, received, (earliest + latest) / 2, (latest - earliest) / 2)
+
+    def update(self, response):
+        # Track the loop time reported by STATUS replies
+        if response.CMD is MSP.STATUS and response.cycleTime:
+            self.cycle = response.cycleTime * 1e-6
+
+    def reset(self):
+        # Forget the link history (e.g. after a reconnect)
+        self.residuals.clear()
+        self.latency = None
+
+    def __repr__(self):
+        latency = "-" if self.latency is None else f"{self.latency * 1e3:.2f}ms"
+        return f"SampleClock(latency={latency}, cycle={self.cycle * 1e3:.2f}ms)"
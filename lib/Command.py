@@ -5,51 +5,293 @@
 # Published under MIT License
 # ===================================================================
 from collections import OrderedDict
+from struct import Struct
 from . import ByteCode as BC
+from .Response import Response, projector, responseType
+
+
+class Registry:
+    # Lookup tables of every concrete command class, filled as they are defined
+    by_code: dict[int, type["MSP_Command"]]
+    by_name: dict[str, type["MSP_Command"]]
+    by_size: dict[int, list[type["MSP_Command"]]]
+
+    def __init__(self):
+        self.by_code = {}
+        self.by_name = {}
+        self.by_size = {}
+
+    def register(self, cls: type["MSP_Command"]):
+        # A later definition with the same code or name replaces the former
+        previous = self.by_code.get(cls.code)
+        if previous is not None:
+            if previous in self.by_size.get(previous.size, ()):
+                self.by_size[previous.size].remove(previous)
+            del self.by_name[previous.__name__]
+        self.by_code[cls.code] = cls
+        self.by_name[cls.__name__] = cls
+        if cls.tail is None:
+            # Variable length commands have no single payload size
+            self.by_size.setdefault(cls.size, []).append(cls)
+
+    def __getitem__(self, code: int) -> type["MSP_Command"]:
+        return self.by_code[code]
+
+    def __contains__(self, code: int) -> bool:
+        return code in self.by_code
+
+    def __iter__(self):
+        return iter(self.by_code.values())
+
+    def get(self, code: int) -> type["MSP_Command"] | None:
+        return self.by_code.get(code)
+
+    def reads(self) -> list[type["ReadCMD"]]:
+        return [cls for cls in self if issubclass(cls, ReadCMD)]
+
+    def writes(self) -> list[type["WriteCMD"]]:
+        return [cls for cls in self if issubclass(cls, WriteCMD)]
+
+    def decode(self, code: int, buffer: bytes) -> Response | bytes | None:
+        # Lazily decoded record (CMD.Response) for known reads, None for
+        # write acknowledgements and the raw payload when no command class
+        # can decode it
+        cls = self.by_code.get(code)
+        if cls is not None and issubclass(cls, WriteCMD):
+            return None
+        if cls is None:
+            return bytes(buffer)
+        try:
+            return cls.Response(bytes(buffer))
+        except AssertionError:
+            return bytes(buffer)
+
+
+COMMANDS = Registry()
+
+
+def mirror(write: dict, read: dict) -> dict[int, int]:
+    # SET_X (and SET_RAW_X) write commands update the state of X
+    names = {CMD.__name__: CMD for CMD in read.values()}
+    result = {}
+    for code, CMD in write.items():
+        name = CMD.__name__.removeprefix("SET_")
+        target = names.get(name) or names.get(name.removeprefix("RAW_"))
+        if target is not None and target.size == CMD.size:
+            result[code] = target.code
+    return result
+
+
+def collect(struct: OrderedDict, args: tuple, kwargs: dict) -> list:
+    # Checked field values, in struct order, from positional and keyword arguments
+    result = []
+    for index, (key, dtype) in enumerate(struct.items()):
+        if key in kwargs:
+            # Keyword arguments has priority
+            value = kwargs[key]
+        elif index < len(args):
+            # Fallback to positional arguments
+            value = args[index]
+        else:
+            # Fallback to the field default (see TypedInteger.default), which
+            # is always in range, or an empty / default compound field
+            result.append(dtype.default if BC.isScalar(dtype) else dtype())
+            continue
+        result.append(checker(dtype)(value))
+    return result
+
+
+def checker(dtype) -> callable:
+    # Validates (and normalizes) a value assigned to a field of this type
+    return dtype.check if BC.isScalar(dtype) else dtype
+
+
+def field(index: int, check: callable) -> property:
+    # Attribute access to one field of a WriteCMD instance
+    def get(self):
+        return self.values[index]
+
+    def set(self, value):
+        self.values[index] = check(value)
+
+    return property(get, set)
+
+
+def compileStruct(struct: OrderedDict, name: str) -> tuple[Struct, tuple | None, bool]:
+    # Returns the codec of the fixed part, the variable-length tail field
+    # (key, dtype) if any, and whether every field is a plain scalar
+    fields = list(struct.items())
+    tail = None
+    if fields and not fields[-1][1].fixed:
+        tail = fields.pop()
+    for key, dtype in fields:
+        assert dtype.fixed, f"{name}.{key}: only the last field may be variable"
+    layout = "".join(dtype.fmt() for _, dtype in fields)
+    simple = tail is None and all(BC.isScalar(dtype) for _, dtype in fields)
+    return Struct(BC.STRUCT_ENDIAN + layout), tail, simple
 
 
 class MSP_Command:
+    __slots__ = ()
     code: int
     struct: OrderedDict
+    # Precompiled binary layout, derived from struct at class definition
+    codec: Struct
+    # Payload size (minimum size if the command has a variable tail)
+    size: int
+    # Trailing variable-length field as (key, dtype), or None
+    tail: tuple | None
+    # True when the payload is a flat list of scalars (fast path)
+    simple: bool
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "struct" not in cls.__dict__:
+            # Abstract prototypes (e.g. ReadCMD) carry no layout
+            return
+        cls.codec, cls.tail, cls.simple = compileStruct(cls.struct, cls.__name__)
+        cls.size = cls.codec.size
+        COMMANDS.register(cls)
 
-class ReadCMD(MSP_Command):
-    def fromBytes(self, buffer: bytes) -> dict:
-        result = OrderedDict()
+    @classmethod
+    def decode(cls, buffer: bytes) -> dict:
         buffer_size = len(buffer)
-        buffer = list(buffer)
-        for key, dtype in self.struct.items():
-            byte_size = dtype.byte_size
-            assert (
-                len(buffer) >= byte_size
-            ), f"insufficient buffer for {self.__class__.__name__} (got {buffer_size} bytes)"
-            chunk = buffer[:byte_size]
-            result[key] = dtype.fromBytes(chunk)
-            buffer = buffer[byte_size:]
-        assert len(buffer) == 0, f"excess buffer for {self.__class__.__name__}"
-        return dict(result)
+        assert (
+            buffer_size >= cls.size
+        ), f"insufficient buffer for {cls.__name__} (got {buffer_size} bytes)"
+        values = cls.codec.unpack_from(buffer)
+        if cls.simple:
+            assert buffer_size == cls.size, f"excess buffer for {cls.__name__}"
+            return dict(zip(cls.struct.keys(), values))
+        result, index = {}, 0
+        for key, dtype in cls.struct.items():
+            if not dtype.fixed:
+                break
+            if BC.isScalar(dtype):
+                result[key] = values[index]
+            else:
+                result[key] = dtype.fromValues(values[index : index + dtype.width])
+            index += dtype.width
+        if cls.tail is None:
+            assert buffer_size == cls.size, f"excess buffer for {cls.__name__}"
+        else:
+            key, dtype = cls.tail
+            result[key] = dtype.decode(memoryview(buffer)[cls.size :])
+        return result
+
+    @classmethod
+    def encode(cls, values: dict) -> bytes:
+        # Missing fields are encoded as their default, like unset arguments
+        if cls.simple:
+            return cls.codec.pack(
+                *(values.get(key, dtype.default) for key, dtype in cls.struct.items())
+            )
+        flat = []
+        for key, dtype in cls.struct.items():
+            if not dtype.fixed:
+                break
+            if BC.isScalar(dtype):
+                flat.append(values.get(key, dtype.default))
+            else:
+                flat.extend(dtype.toValues(dtype(values.get(key))))
+        data = cls.codec.pack(*flat)
+        if cls.tail is not None:
+            key, dtype = cls.tail
+            data += dtype.encode(dtype(values.get(key)))
+        return data
+
+
+class ReadCMD(MSP_Command):
+    # Optional arguments sent along with the read request (e.g. WP number)
+    args: OrderedDict = OrderedDict()
+    args_codec: Struct = Struct("")
+    query: bytes = b""
+    # Lazily decoded record type of the reply (see lib/Response.py)
+    Response: type[Response]
+    # Compiled projections, keyed by the requested field(s)
+    projectors: dict
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "struct" in cls.__dict__:
+            cls.Response = responseType(cls)
+            cls.projectors = {}
+        if "args" in cls.__dict__:
+            cls.args_codec, _, simple = compileStruct(cls.args, cls.__name__)
+            assert simple, f"{cls.__name__}: request arguments must be scalars"
+
+    def __init__(self, *args, **kwargs):
+        if self.args:
+            self.query = self.args_codec.pack(*collect(self.args, args, kwargs))
+
+    def fromBytes(self, buffer: bytes, timing=None) -> Response:
+        return self.Response(buffer, timing)
+
+    @classmethod
+    def project(cls, buffer: bytes, fields: str | tuple):
+        # Decode only the given field, or tuple of fields
+        get = cls.projectors.get(fields)
+        if get is None:
+            get = cls.projectors[fields] = projector(cls, fields)
+        return get(buffer)
 
 
 class WriteCMD(MSP_Command):
-    payload: OrderedDict[any, BC.TypedInteger]
+    """
+    Mutable command, meant to be created once and updated in place:
+        rc = MSP.SET_RAW_RC(1500, 1500, 1500, 1000)
+        rc.THROTTLE = 1200              # or rc["THROTTLE"] = 1200
+        rc.update(ROLL=1400, PITCH=1600)
+    Assigned values are checked against the range of their field (see
+    TypedInteger.within), unset fields are 0.
+    """
+
+    __slots__ = ("values",)
+    # Field values in struct order
+    values: list
+    # key -> index in values, and the checker of every field
+    fields: dict
+    checks: tuple
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "struct" not in cls.__dict__:
+            return
+        cls.fields = {key: index for index, key in enumerate(cls.struct)}
+        cls.checks = tuple(map(checker, cls.struct.values()))
+        for key, index in cls.fields.items():
+            # Identifier keys are also attributes (e.g. rc.THROTTLE)
+            if isinstance(key, str) and key.isidentifier() and not hasattr(cls, key):
+                setattr(cls, key, field(index, cls.checks[index]))
 
     def __init__(self, *args, **kwargs):
-        self.payload = OrderedDict()
-        entries = self.struct.items()
-        indexes = range(len(entries))
-        for index, (key, dtype) in zip(indexes, entries):
-            if key in kwargs:
-                # Keyword arguments has priority
-                self.payload[key] = dtype(kwargs[key])
-            elif index < len(args):
-                # Fallback to positional arguments
-                self.payload[key] = dtype(args[index])
-            else:
-                # Fallback to 0
-                self.payload[key] = dtype(0)
+        self.values = collect(self.struct, args, kwargs)
+
+    def __getitem__(self, key):
+        return self.values[self.fields[key]]
+
+    def __setitem__(self, key, value):
+        index = self.fields[key]
+        self.values[index] = self.checks[index](value)
+
+    def update(self, *args, **kwargs):
+        # Same argument convention as __init__, unspecified fields untouched
+        assert len(args) <= len(self.values), f"too many values for {self}"
+        values, checks = self.values, self.checks
+        for index, value in enumerate(args):
+            values[index] = checks[index](value)
+        for key, value in kwargs.items():
+            self[key] = value
+
+    @property
+    def payload(self) -> dict:
+        return dict(zip(self.struct, self.values))
 
     def toBytes(self) -> bytes:
-        result = bytes()
-        for val in self.payload.values():
-            result += val.bytes
-        return result
+        if self.simple:
+            return self.codec.pack(*self.values)
+        return self.encode(self.payload)
+
+    def __repr__(self):
+        items = ", ".join(f"{k}={v!r}" for k, v in zip(self.struct, self.values))
+        return f"{type(self).__name__}({items})"
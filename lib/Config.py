@@ -0,0 +1,138 @@
+# ===================================================================
+# Transactional configuration sync
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   with ConfigSession(fc) as config:   # snapshot PID, RC_TUNING, MISC ...
+#       config[MSP.PID]["A_ROLL"] = 40
+#       config.edit(MSP.MISC, MAXTHROTTLE=1850)
+#   # on exit: only SET_PID and SET_MISC are sent, in one write, followed
+#   # by their read-back and a single EEPROM_WRITE
+# Nothing is written if nothing changed. A read-back that differs from
+# the written payload raises VerifyError before EEPROM_WRITE is sent, so
+# the EEPROM keeps the last known good configuration.
+# ===================================================================
+from . import MSP
+from .Command import COMMANDS, ReadCMD, WriteCMD, mirror
+from .MultiWii import MultiWii
+
+# Configuration readable from the controller, written by the matching SET_X
+CONFIG = (MSP.PID, MSP.RC_TUNING, MSP.MISC, MSP.BOX, MSP.SERVO_CONF)
+
+
+class VerifyError(RuntimeError):
+    """
+    Raised by ConfigSession.commit() when the read-back of some written
+    command does not match, `mismatched` maps them to what was read.
+    """
+
+    def __init__(self, mismatched: dict[type[ReadCMD], bytes]):
+        names = ", ".join(CMD.__name__ for CMD in mismatched)
+        super().__init__(f"read-back differs from written value for {names}")
+        self.mismatched = mismatched
+
+
+def writers(commands) -> dict[type[ReadCMD], type[WriteCMD]]:
+    # Write command of every readable configuration command
+    reads = {CMD.code: CMD for CMD in commands}
+    writes = {CMD.code: CMD for CMD in COMMANDS.writes()}
+    return {
+        COMMANDS[read]: COMMANDS[write] for write, read in mirror(writes, reads).items()
+    }
+
+
+class ConfigSession:
+    # Payload of each command as last read from (or written to) the board
+    original: dict[type[ReadCMD], bytes]
+    # Editable field values of each command
+    values: dict[type[ReadCMD], dict]
+
+    def __init__(self, fc: MultiWii, commands=CONFIG, timeout: float = 1.0):
+        self.fc = fc
+        self.timeout = timeout
+        self.writers = writers(commands)
+        for CMD in commands:
+            assert CMD in self.writers, f"{CMD.__name__} has no write command"
+        self.original = {}
+        self.values = {}
+        self.snapshot()
+
+    def snapshot(self):
+        # Read every command in one batch, discarding pending edits
+        replies = self.fc.invoke_many([CMD() for CMD in self.writers], self.timeout)
+        for CMD, reply in zip(self.writers, replies):
+            self.original[CMD] = bytes(reply.payload)
+            self.values[CMD] = reply.to_dict()
+
+    def __getitem__(self, CMD: type[ReadCMD]) -> dict:
+        return self.values[CMD]
+
+    def edit(self, CMD: type[ReadCMD], **values):
+        for key, value in values.items():
+            assert key in CMD.struct, f"{CMD.__name__} has no field {key}"
+            self.values[CMD][key] = value
+
+    def __encode__(self, CMD: type[ReadCMD]) -> bytes:
+        return CMD.encode(self.values[CMD])
+
+    def changes(self) -> dict[type[ReadCMD], bytes]:
+        # Commands whose encoded payload differs from the board
+        result = {}
+        for CMD in self.writers:
+            payload = self.__encode__(CMD)
+            if payload != self.original[CMD]:
+                result[CMD] = payload
+        return result
+
+    def diff(self) -> dict[type[ReadCMD], dict]:
+        # {CMD: {key: (old, new)}} of every edited field
+        result = {}
+        for CMD in self.changes():
+            old = CMD.decode(self.original[CMD])
+            new = CMD.decode(self.__encode__(CMD))
+            result[CMD] = {k: (old[k], new[k]) for k in new if old.get(k) != new[k]}
+        return result
+
+    def commit(self, verify: bool = True, eeprom: bool = True) -> list[type[ReadCMD]]:
+        """
+        Send the SET_X of every changed command in a single write, followed
+        by their read-back (if verify) and one EEPROM_WRITE (if eeprom).
+        Returns the committed commands, empty when nothing changed.
+        """
+        changes = self.changes()
+        if not changes:
+            return []
+        batch = []
+        for CMD in changes:
+            SET = self.writers[CMD]
+            batch.append(SET(*self.values[CMD].values()))
+        if verify:
+            batch += [CMD() for CMD in changes]
+        replies = self.fc.invoke_many(batch, self.timeout)
+        if verify:
+            mismatched = {}
+            for CMD, reply in zip(changes, replies[len(changes) :]):
+                if bytes(reply.payload) != changes[CMD]:
+                    mismatched[CMD] = bytes(reply.payload)
+            if mismatched:
+                raise VerifyError(mismatched)
+        if eeprom:
+            self.fc.invoke(MSP.EEPROM_WRITE())
+        for CMD, payload in changes.items():
+            self.original[CMD] = payload
+            self.values[CMD] = CMD.decode(payload)
+        return list(changes)
+
+    def rollback(self):
+        # Discard pending edits
+        for CMD, payload in self.original.items():
+            self.values[CMD] = CMD.decode(payload)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error, *args):
+        if error is None:
+            self.commit()
@@ -0,0 +1,144 @@
+# ===================================================================
+# Multi-vehicle connection manager, one worker thread per link
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   fleet = FleetManager()                      # every /dev/ttyACM* device
+#   fleet = FleetManager(["/dev/ttyACM0", "/dev/ttyACM1"])
+#   fleet.broadcast(MSP.SET_RAW_RC(1500, 1500, 1500, 1000))
+#   attitudes = fleet.gather(MSP.ATTITUDE())    # one entry per vehicle
+# Every link is served by its own worker thread, so a broadcast or gather
+# costs about one round-trip in total instead of one per vehicle.
+# ===================================================================
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from .Command import ReadCMD, WriteCMD
+from .MultiWii import MultiWii
+from .Transport import Transport, discover_all
+
+
+class LinkStats:
+    started: float
+    ops: int
+    errors: int
+    last_ok: float | None
+    last_error: Exception | None
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ops = 0
+        self.errors = 0
+        self.last_ok = None
+        self.last_error = None
+
+    @property
+    def throughput(self) -> float:
+        # Completed commands per second since the link was opened
+        return self.ops / (time.monotonic() - self.started)
+
+    @property
+    def healthy(self) -> bool:
+        return self.last_error is None
+
+
+class Link:
+    fc: MultiWii
+    name: str
+    stats: LinkStats
+
+    def __init__(self, fc: MultiWii, name: str):
+        self.fc = fc
+        self.name = name
+        self.stats = LinkStats()
+        # Single worker: commands on one link are serialized
+        self.worker = ThreadPoolExecutor(1, thread_name_prefix=f"MSP {name}")
+
+    def __run__(self, command: ReadCMD | WriteCMD, timeout: float):
+        try:
+            if isinstance(command, ReadCMD):
+                (result,) = self.fc.invoke_many([command], timeout)
+            else:
+                result = self.fc.invoke(command)
+        except Exception as e:
+            self.stats.errors += 1
+            self.stats.last_error = e
+            raise
+        self.stats.ops += 1
+        self.stats.last_ok = time.monotonic()
+        self.stats.last_error = None
+        return result
+
+    def submit(self, command: ReadCMD | WriteCMD, timeout: float) -> Future:
+        return self.worker.submit(self.__run__, command, timeout)
+
+    def health(self) -> dict:
+        parser = self.fc.parser
+        return dict(
+            healthy=self.stats.healthy,
+            ops=self.stats.ops,
+            errors=self.stats.errors,
+            throughput=self.stats.throughput,
+            last_ok=self.stats.last_ok,
+            last_error=self.stats.last_error,
+            frames=parser.frames,
+            checksum_errors=parser.checksum_errors,
+            garbage_bytes=parser.garbage_bytes,
+        )
+
+    def close(self):
+        self.worker.shutdown()
+        self.fc.serial.close()
+
+
+class FleetManager:
+    links: list[Link]
+
+    def __init__(
+        self,
+        paths: list[str | MultiWii | Transport] = None,
+        baud: int = 115200,
+        timeout: float = 0.1,
+    ):
+        if paths is None:
+            paths = discover_all()
+        self.links = []
+        for index, path in enumerate(paths):
+            if isinstance(path, MultiWii):
+                fc, name = path, f"link{index}"
+            elif isinstance(path, str):
+                fc, name = MultiWii(path, baud, timeout), path
+            else:
+                fc, name = MultiWii(transport=path), f"link{index}"
+            self.links.append(Link(fc, name))
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def submit(self, command: ReadCMD | WriteCMD, timeout: float = 1.0) -> list:
+        return [link.submit(command, timeout) for link in self.links]
+
+    def gather(self, command: ReadCMD | WriteCMD, timeout: float = 1.0) -> list:
+        # Results in link order. A link that failed yields its exception
+        # object instead of a result, like asyncio.gather(return_exceptions=True)
+        futures = self.submit(command, timeout)
+        wait(futures)
+        return [f.exception() or f.result() for f in futures]
+
+    def broadcast(self, command: WriteCMD) -> list:
+        assert isinstance(command, WriteCMD), "only write commands can be broadcast"
+        return self.gather(command)
+
+    def health(self) -> dict[str, dict]:
+        return {link.name: link.health() for link in self.links}
+
+    def close(self):
+        for link in self.links:
+            link.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
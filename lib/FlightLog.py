@@ -0,0 +1,198 @@
+# ===================================================================
+# Binary flight log of raw MSP traffic, with memory-mapped replay
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# File layout (all integers little-endian):
+#   header  = magic "MSPLOG" | version U16 | start time F64 (unix epoch)
+#   record  = time F64 | direction U8 | code U16 | size U16 | <payload>
+#   ...
+#   index   = entries U32 | entries x (code U16 | direction U8 | count U32)
+#             followed by count x offset U64 for each entry
+#   trailer = index offset U64 | magic "MSPINDEX"
+# The index is appended when the writer is closed. Logs lacking it
+# (e.g. after a crash) are indexed by walking record headers on open,
+# payloads are never parsed until requested.
+# ===================================================================
+import mmap, time
+from array import array
+from struct import Struct
+from typing import NamedTuple
+from .Command import MSP_Command, ReadCMD
+from .Stream import DIRECTION
+
+MAGIC = b"MSPLOG"
+INDEX_MAGIC = b"MSPINDEX"
+VERSION = 1
+
+HEADER = Struct("<6sHd")
+RECORD = Struct("<dBHH")
+INDEX_HEAD = Struct("<I")
+INDEX_ENTRY = Struct("<HBI")
+TRAILER = Struct("<Q8s")
+
+
+class Frame(NamedTuple):
+    time: float
+    direction: int
+    code: int
+    payload: memoryview
+
+    def decode(self, CMD: type[ReadCMD]) -> dict:
+        assert self.code == CMD.code, f"frame {self.code} is not {CMD.__name__}"
+        # Plain dict, nothing keeps a reference into the mapped file
+        return CMD.decode(self.payload)
+
+
+class LogWriter:
+    # (code, direction) -> offsets of matching records
+    index: dict[tuple[int, int], array]
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self.offset = HEADER.size
+        self.index = {}
+        # Link the writer is attached to, if any
+        self.fc = None
+
+    def write(self, direction: int, code: int, payload: bytes, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        key = (code, direction)
+        if key not in self.index:
+            self.index[key] = array("Q")
+        self.index[key].append(self.offset)
+        self.file.write(RECORD.pack(timestamp, direction, code, len(payload)))
+        self.file.write(payload)
+        self.offset += RECORD.size + len(payload)
+
+    def attach(self, fc):
+        # Log every frame exchanged by a MultiWii / AsyncMultiWii link
+        self.detach()
+        fc.hooks.append(self.write)
+        self.fc = fc
+
+    def detach(self):
+        if self.fc is not None and self.write in self.fc.hooks:
+            self.fc.hooks.remove(self.write)
+        self.fc = None
+
+    def close(self):
+        self.detach()
+        if self.file.closed:
+            return
+        write = self.file.write
+        write(INDEX_HEAD.pack(len(self.index)))
+        for (code, direction), offsets in self.index.items():
+            write(INDEX_ENTRY.pack(code, direction, len(offsets)))
+            write(offsets.tobytes())
+        write(TRAILER.pack(self.offset, INDEX_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LogReader:
+    start_time: float
+    # (code, direction) -> offsets of matching records (zero-copy when the
+    # log carries an index)
+    index: dict[tuple[int, int], memoryview | array]
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+        magic, version, self.start_time = HEADER.unpack_from(self.mmap)
+        assert magic == MAGIC, f"{path} is not an MSP log"
+        assert version == VERSION, f"unsupported MSP log version {version}"
+        if not self.__load_index__():
+            self.__scan_index__()
+
+    def __load_index__(self) -> bool:
+        if len(self.mmap) < HEADER.size + TRAILER.size:
+            return False
+        end, magic = TRAILER.unpack_from(self.mmap, len(self.mmap) - TRAILER.size)
+        if magic != INDEX_MAGIC:
+            return False
+        self.end = end
+        self.index = {}
+        (entries,) = INDEX_HEAD.unpack_from(self.mmap, end)
+        cursor = end + INDEX_HEAD.size
+        for _ in range(entries):
+            code, direction, count = INDEX_ENTRY.unpack_from(self.mmap, cursor)
+            cursor += INDEX_ENTRY.size
+            self.index[(code, direction)] = self.view[cursor : cursor + count * 8].cast(
+                "Q"
+            )
+            cursor += count * 8
+        return True
+
+    def __scan_index__(self):
+        self.index = {}
+        offset, size = HEADER.size, len(self.mmap)
+        while offset + RECORD.size <= size:
+            _, direction, code, length = RECORD.unpack_from(self.mmap, offset)
+            if offset + RECORD.size + length > size:
+                # Truncated last record
+                break
+            key = (code, direction)
+            if key not in self.index:
+                self.index[key] = array("Q")
+            self.index[key].append(offset)
+            offset += RECORD.size + length
+        self.end = offset
+
+    def __len__(self) -> int:
+        return sum(len(offsets) for offsets in self.index.values())
+
+    def frame(self, offset: int) -> Frame:
+        timestamp, direction, code, length = RECORD.unpack_from(self.mmap, offset)
+        start = offset + RECORD.size
+        return Frame(timestamp, direction, code, self.view[start : start + length])
+
+    def __iter__(self):
+        # All frames in recording order
+        offset = HEADER.size
+        while offset < self.end:
+            frame = self.frame(offset)
+            offset += RECORD.size + len(frame.payload)
+            yield frame
+
+    def offsets(self, CMD: type[MSP_Command], direction: int = DIRECTION.RECV):
+        return self.index.get((CMD.code, direction), ())
+
+    def at(self, CMD: type[MSP_Command], n: int, direction: int = DIRECTION.RECV):
+        # Random access to the n-th frame of one command
+        return self.frame(self.offsets(CMD, direction)[n])
+
+    def frames(self, CMD: type[MSP_Command], direction: int = DIRECTION.RECV):
+        # Frames of one command, without touching any other record
+        for offset in self.offsets(CMD, direction):
+            yield self.frame(offset)
+
+    def decode(self, CMD: type[ReadCMD], direction: int = DIRECTION.RECV):
+        # Lazily decoded (time, dict) pairs of one command
+        for frame in self.frames(CMD, direction):
+            yield frame.time, CMD.decode(frame.payload)
+
+    def close(self):
+        # Frame payloads still referenced keep the file mapped: the mapping
+        # is then released along with the last of them
+        self.index = {}
+        self.view.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -10,6 +10,10 @@ from collections import OrderedDict
 from .ByteCode import *
 from .Command import ReadCMD, WriteCMD
 
+# Documented value ranges, checked when a write command field is assigned
+PWM = U16.within(1000, 2000)
+PERCENT = U8.within(0, 100)
+
 
 class IDENT(ReadCMD):
     code = 100
@@ -90,8 +94,9 @@ class SET_MOTOR(WriteCMD):
     Range [1000;2000]
     """
 
+    __slots__ = ()
     code = 214
-    struct = OrderedDict(**U16.ARRAY(MAX_SUPPORTED_MOTORS))
+    struct = OrderedDict(**PWM.ARRAY(MAX_SUPPORTED_MOTORS))
 
 
 class RC(ReadCMD):
@@ -116,13 +121,14 @@ class SET_RAW_RC(WriteCMD):
     Each chan overrides legacy RX as long as it is refreshed at least every second. See UART radio projects for more details.
     """
 
+    __slots__ = ()
     code = 200
     struct = OrderedDict(
-        ROLL=U16,
-        PITCH=U16,
-        YAW=U16,
-        THROTTLE=U16,
-        **U16.ARRAY(12, start=1, prefix="AUX"),
+        ROLL=PWM,
+        PITCH=PWM,
+        YAW=PWM,
+        THROTTLE=PWM,
+        **PWM.ARRAY(12, start=1, prefix="AUX"),
     )
 
 
@@ -144,6 +150,7 @@ class SET_RAW_GPS(WriteCMD):
     this request is used to inject GPS data (annex GPS device or simulation purpose)
     """
 
+    __slots__ = ()
     code = 201
     struct = OrderedDict(
         GPS_FIX=U8,
@@ -205,15 +212,16 @@ class RC_TUNING(ReadCMD):
 
 
 class SET_RC_TUNING(WriteCMD):
+    __slots__ = ()
     code = 204
     struct = OrderedDict(
-        byteRC_RATE=U8,
-        byteRC_EXPO=U8,
-        byteRollPitchRate=U8,
-        byteYawRate=U8,
-        byteDynThrPID=U8,
-        byteThrottle_MID=U8,
-        byteThrottle_EXPO=U8,
+        byteRC_RATE=PERCENT,
+        byteRC_EXPO=PERCENT,
+        byteRollPitchRate=PERCENT,
+        byteYawRate=PERCENT,
+        byteDynThrPID=PERCENT,
+        byteThrottle_MID=PERCENT,
+        byteThrottle_EXPO=PERCENT,
     )
 
 
@@ -248,6 +256,7 @@ class PID(ReadCMD):
 
 
 class SET_PID(WriteCMD):
+    __slots__ = ()
     code = 202
     struct = OrderedDict(
         # PIDITEMS x conf.pid[]
@@ -267,14 +276,17 @@ class BOX(ReadCMD):
         # The size of the message is enough to know the number of BOX
         # For each BOX, there is a 16 bit variable which indicates the AUX1->AUX4 activation switch.
         # Bit 1: AUX1 LOW state / bit 2: AUX1 MID state / bit 3: AUX1 HIGH state / bit 4: AUX2 LOW state ….. bit 13: AUX 4 HIGH state
+        activate=Repeated(U16),
     )
 
 
 class SET_BOX(WriteCMD):
+    __slots__ = ()
     code = 203
     struct = OrderedDict(
         # BOXITEMS x conf.activate[]
         # BOXITEMS x UINT 16
+        activate=Repeated(U16),
     )
 
 
@@ -306,15 +318,16 @@ class MISC(ReadCMD):
 
 
 class SET_MISC(WriteCMD):
+    __slots__ = ()
     code = 207
     struct = OrderedDict(
         intPowerTrigger1=U16,
-        conf_minthrottle=U16,
-        MAXTHROTTLE=U16,
+        conf_minthrottle=PWM,
+        MAXTHROTTLE=PWM,
         # not used currently as a set variable
         MINCOMMAND=U16,
         # not used currently as a set variable
-        conf_failsafe_throttle=U16,
+        conf_failsafe_throttle=PWM,
         plog_arm=U16,
         # not used, it's here to have the same struct as get
         plog_lifetime=U32,
@@ -344,76 +357,95 @@ class MOTOR_PINS(ReadCMD):
     )
 
 
-# class BOXNAMES(ReadCMD):
-#     # all the configured CHECKBOX name separated by ";"
-#     code = 116
-#     struct = OrderedDict(
-#         # string of BOX items
-#         # string
-#     )
+class BOXNAMES(ReadCMD):
+    # all the configured CHECKBOX name separated by ";"
+    code = 116
+    struct = OrderedDict(
+        # string of BOX items
+        names=String(";"),
+    )
 
-# class PIDNAMES(ReadCMD):
-#     # all the PID name separated by ";"
-#     code = 117
-#     struct = OrderedDict(
-#         # string of PID items
-#         # string
-#     )
 
-# class WP(ReadCMD):
-#     # not fully implemented yet, works partially for HOME POSITION (wp 0) and HOLD position (wp 15)
-#     code = 118
-#     struct = OrderedDict(
-#         wp_no=U8,
-#         lat=U32,
-#         lon=U32,
-#         AltHold=U32,
-#         heading=U16,
-#         time to stay=U16,
-#         nav flag=U8,
-#     )
+class PIDNAMES(ReadCMD):
+    # all the PID name separated by ";"
+    code = 117
+    struct = OrderedDict(
+        # string of PID items
+        names=String(";"),
+    )
 
-# class SET_WP(WriteCMD):
-#     code = 209
-#     struct = OrderedDict(
-#         wp_no=U8,
-#         lat=U32,
-#         lon=U32,
-#         AltHold=U32,
-#         heading=U16,
-#         time to stay=U16,
-#         nav flag=U8,
-#     )
 
-# class BOXIDS(ReadCMD):
-#     code = 119
-#     struct = OrderedDict(
-#         # ID*CHECKBOXITEMS
-#         # CHECKBOXITEMS x UINT 8
-#         # each BOX (used or not) have a unique ID.
-#         # In order to retrieve the number of BOX and which BOX are in used, this request can be used.
-#         # It is more efficient than retrieving BOX names if you know what BOX function is behing the ID.
-#         # See enum MultiWii.cpp (0: ARM, 1 ANGLE, 2 HORIZON, …)
-#     )
+class WP(ReadCMD):
+    # not fully implemented yet, works partially for HOME POSITION (wp 0) and HOLD position (wp 15)
+    code = 118
+    args = OrderedDict(
+        wp_no=U8,
+        # number of the requested waypoint
+    )
+    struct = OrderedDict(
+        wp_no=U8,
+        lat=U32,
+        lon=U32,
+        AltHold=U32,
+        heading=U16,
+        time_to_stay=U16,
+        nav_flag=U8,
+    )
 
-# class SERVO_CONF(ReadCMD):
-#     code = 120
-#     struct = OrderedDict(
-#         # 8 x conf.servoConf[]
-#         # 8 x [UINT 16, UINT 16, UINT 16, UINT 8]
-#         # struct servo_conf_ is 7 bytes length: min:2 / max:2 / middle:2 / rate:1
-#         # [1000;2000], [1000;2000], [1000;2000], [0;100]
-#         # Special use:
-#         # middle normal range is [1000;2000]
-#         # If middle < RC_CHANS => the relevant rc channel is the middle position of the servo (usefull for gimbal where you wnt to control the middle axis via a rc chan)</p><p>Depending on the servo use in multiwii type, rate is used to reverse the direction of servo (first bit) or to set a proportional range
-#     )
 
-# class SET_SERVO_CONF(WriteCMD):
-#     code = 212
-#     struct = OrderedDict(
-#         # 8 x conf.servoConf[]
-#         # 8 x [UINT 16, UINT 16, UINT 16, UINT 8]
-#     )
+class SET_WP(WriteCMD):
+    __slots__ = ()
+    code = 209
+    struct = OrderedDict(
+        wp_no=U8,
+        lat=U32,
+        lon=U32,
+        AltHold=U32,
+        heading=U16,
+        time_to_stay=U16,
+        nav_flag=U8,
+    )
+
+
+class BOXIDS(ReadCMD):
+    code = 119
+    struct = OrderedDict(
+        # ID*CHECKBOXITEMS
+        # CHECKBOXITEMS x UINT 8
+        # each BOX (used or not) have a unique ID.
+        # In order to retrieve the number of BOX and which BOX are in used, this request can be used.
+        # It is more efficient than retrieving BOX names if you know what BOX function is behing the ID.
+        # See enum MultiWii.cpp (0: ARM, 1 ANGLE, 2 HORIZON, …)
+        ids=Repeated(U8),
+    )
+
+
+# struct servo_conf_ is 7 bytes length: min:2 / max:2 / middle:2 / rate:1
+# [1000;2000], [1000;2000], [1000;2000], [0;100]
+# Special use:
+# middle normal range is [1000;2000]
+# If middle < RC_CHANS => the relevant rc channel is the middle position of the servo (usefull for gimbal where you wnt to control the middle axis via a rc chan)
+# Depending on the servo use in multiwii type, rate is used to reverse the direction of servo (first bit) or to set a proportional range
+SERVO_CONF_ITEM = Record("ServoConf", min=U16, max=U16, middle=U16, rate=U8)
+
+
+class SERVO_CONF(ReadCMD):
+    code = 120
+    struct = OrderedDict(
+        # 8 x conf.servoConf[]
+        # 8 x [UINT 16, UINT 16, UINT 16, UINT 8]
+        servoConf=Repeated(SERVO_CONF_ITEM, 8),
+    )
+
+
+class SET_SERVO_CONF(WriteCMD):
+    __slots__ = ()
+    code = 212
+    struct = OrderedDict(
+        # 8 x conf.servoConf[]
+        # 8 x [UINT 16, UINT 16, UINT 16, UINT 8]
+        servoConf=Repeated(SERVO_CONF_ITEM, 8),
+    )
 
 
 class ACC_CALIBRATION(WriteCMD):
@@ -421,6 +453,7 @@ class ACC_CALIBRATION(WriteCMD):
     trigger calibration of ACC
     """
 
+    __slots__ = ()
     code = 205
     struct = OrderedDict(
         # no param
@@ -432,6 +465,7 @@ class MAG_CALIBRATION(WriteCMD):
     trigger calibration of MAG
     """
 
+    __slots__ = ()
     code = 206
     struct = OrderedDict(
         # no param
@@ -443,6 +477,7 @@ class RESET_CONF(WriteCMD):
     reset all params to default
     """
 
+    __slots__ = ()
     code = 208
     struct = OrderedDict(
         # no param
@@ -459,9 +494,10 @@ class RESET_CONF(WriteCMD):
 
 
 class SET_HEAD(WriteCMD):
+    __slots__ = ()
     code = 211
     struct = OrderedDict(
-        magHold=I16,
+        magHold=I16.within(-180, 180),
         # Set a new head lock reference
         # Range [-180;+180]
     )
@@ -472,6 +508,7 @@ class BIND(WriteCMD):
     Currently only uses to bind spektrum sttellites
     """
 
+    __slots__ = ()
     code = 240
     struct = OrderedDict(
         # no param
@@ -483,6 +520,7 @@ class EEPROM_WRITE(WriteCMD):
     write the settings to the eeprom
     """
 
+    __slots__ = ()
     code = 250
     struct = OrderedDict(
         # no param
@@ -0,0 +1,233 @@
+# ===================================================================
+# Link instrumentation: latency histograms and traffic counters
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   fc.metrics = LinkMetrics(fc)
+#   ...
+#   fc.metrics.rtt[MSP.RC.code].quantile(0.99)   # seconds
+#   fc.metrics.utilization()                     # (in, out) share of baud
+#   print(fc.metrics.prometheus(link="fc0"))     # text exposition format
+#   fc.metrics.callbacks.append(lambda event, code, value: ...)
+# Received frames, bytes, checksum errors and garbage bytes are counted
+# by the frame parser anyway, so only sent traffic, round-trip times and
+# timeouts cost anything extra: a few additions per request.
+# ===================================================================
+import time
+from bisect import bisect_left
+from .Command import COMMANDS
+from .Timeout import BITS_PER_BYTE
+
+# Default histogram bucket upper bounds, in seconds
+RTT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class Histogram:
+    bounds: tuple[float, ...]
+    # Observations per bucket, the last one counts values above all bounds
+    counts: list[int]
+    count: int
+    sum: float
+
+    def __init__(self, bounds: tuple[float, ...] = RTT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th quantile (inf if above)
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def __repr__(self):
+        return (
+            f"Histogram(count={self.count}, mean={self.mean * 1e3:.2f}ms, "
+            f"p99<={self.quantile(0.99) * 1e3:.1f}ms)"
+        )
+
+
+class LinkMetrics:
+    # Sent traffic (received traffic is counted by the parser)
+    frames_out: int
+    bytes_out: int
+    # Reads that expired while a reply was expected
+    timeouts: int
+    # Command code -> round-trip time histogram
+    rtt: dict[int, Histogram]
+    # Callbacks (event, code, value) for "rtt" (seconds) and "timeout" events
+    callbacks: list
+
+    def __init__(self, fc, buckets: tuple[float, ...] = RTT_BUCKETS):
+        self.parser = fc.parser
+        self.baudrate = getattr(fc.serial, "baudrate", None)
+        self.buckets = buckets
+        self.callbacks = []
+        self.reset()
+
+    def reset(self):
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.timeouts = 0
+        self.rtt = {}
+        self.start = time.monotonic()
+        parser = self.parser
+        # Parser counters are cumulative, remember where this window starts
+        self.__base__ = (
+            parser.frames,
+            parser.total_bytes,
+            parser.checksum_errors,
+            parser.garbage_bytes,
+        )
+
+    # -- Recording, called by MultiWii --------------------------------
+
+    def sent(self, size: int, frames: int = 1):
+        self.frames_out += frames
+        self.bytes_out += size
+
+    def observe(self, code: int, seconds: float):
+        histogram = self.rtt.get(code)
+        if histogram is None:
+            histogram = self.rtt[code] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        for callback in self.callbacks:
+            callback("rtt", code, seconds)
+
+    def timeout(self, code: int | None):
+        self.timeouts += 1
+        for callback in self.callbacks:
+            callback("timeout", code, None)
+
+    # -- Derived statistics -------------------------------------------
+
+    @property
+    def frames_in(self) -> int:
+        return self.parser.frames - self.__base__[0]
+
+    @property
+    def bytes_in(self) -> int:
+        return self.parser.total_bytes - self.__base__[1]
+
+    @property
+    def checksum_errors(self) -> int:
+        return self.parser.checksum_errors - self.__base__[2]
+
+    @property
+    def garbage_bytes(self) -> int:
+        # Bytes skipped while resynchronizing on a preamble
+        return self.parser.garbage_bytes - self.__base__[3]
+
+    def utilization(self) -> tuple[float, float] | None:
+        # Share of the line capacity used (in, out), None if baud is unknown
+        elapsed = time.monotonic() - self.start
+        if not self.baudrate or elapsed <= 0:
+            return None
+        capacity = elapsed * self.baudrate / BITS_PER_BYTE
+        return self.bytes_in / capacity, self.bytes_out / capacity
+
+    def __repr__(self):
+        return (
+            f"LinkMetrics(frames={self.frames_in}/{self.frames_out}, "
+            f"bytes={self.bytes_in}/{self.bytes_out}, timeouts={self.timeouts}, "
+            f"checksum_errors={self.checksum_errors}, garbage={self.garbage_bytes})"
+        )
+
+    # -- Export ---------------------------------------------------------
+
+    def prometheus(self, prefix: str = "msp", **labels) -> str:
+        """
+        Prometheus text exposition format, extra keyword arguments become
+        labels of every sample (e.g. link="fc0").
+        """
+        lines = []
+
+        def label(**extra) -> str:
+            items = {**labels, **extra}
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items.items()) + "}"
+
+        def metric(name: str, kind: str, help: str, samples):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, extra, value in samples:
+                lines.append(f"{prefix}_{name}{suffix}{label(**extra)} {value}")
+
+        metric(
+            "frames_total",
+            "counter",
+            "Frames on the link.",
+            [
+                ("", {"direction": "in"}, self.frames_in),
+                ("", {"direction": "out"}, self.frames_out),
+            ],
+        )
+        metric(
+            "bytes_total",
+            "counter",
+            "Bytes on the link.",
+            [
+                ("", {"direction": "in"}, self.bytes_in),
+                ("", {"direction": "out"}, self.bytes_out),
+            ],
+        )
+        metric(
+            "timeouts_total",
+            "counter",
+            "Reads expired while a reply was expected.",
+            [("", {}, self.timeouts)],
+        )
+        metric(
+            "checksum_errors_total",
+            "counter",
+            "Received frames dropped for a bad checksum.",
+            [("", {}, self.checksum_errors)],
+        )
+        metric(
+            "garbage_bytes_total",
+            "counter",
+            "Received bytes skipped while resynchronizing.",
+            [("", {}, self.garbage_bytes)],
+        )
+        utilization = self.utilization()
+        if utilization is not None:
+            metric(
+                "link_utilization_ratio",
+                "gauge",
+                "Share of the serial line capacity in use.",
+                [
+                    ("", {"direction": "in"}, utilization[0]),
+                    ("", {"direction": "out"}, utilization[1]),
+                ],
+            )
+        samples = []
+        for code, histogram in sorted(self.rtt.items()):
+            CMD = COMMANDS.get(code)
+            command = CMD.__name__ if CMD is not None else str(code)
+            seen = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                seen += count
+                samples.append(("_bucket", {"command": command, "le": bound}, seen))
+            samples.append(
+                ("_bucket", {"command": command, "le": "+Inf"}, histogram.count)
+            )
+            samples.append(("_sum", {"command": command}, histogram.sum))
+            samples.append(("_count", {"command": command}, histogram.count))
+        metric("rtt_seconds", "histogram", "Request round-trip time.", samples)
+        return "\n".join(lines) + "\n"
@@ -16,76 +16,384 @@
 #   data      = as per the table below. UINT16 values are LSB first.
 #   crc       = XOR of <size>, <command> and each data byte into a zero'ed sum
 # ===================================================================
-import serial, glob
-from .Command import ReadCMD, WriteCMD
-from .ByteCode import U8
+import time
+from collections import deque
+from .Command import COMMANDS, ReadCMD, WriteCMD
+from .Response import Response
+from .Stream import (
+    PREAMBLE,
+    DIRECTION,
+    MAX_V2_PAYLOAD,
+    FrameParser,
+    frame,
+    pickVersion,
+)
+from .Transport import ReconnectingSerial, SocketTransport, Transport, open_serial
+from .Sender import FrameSender
+from .Cache import ResponseCache
+from .Metrics import LinkMetrics
+from .Timeout import FRAME_OVERHEAD, RTTEstimator
+from .Clock import SampleClock, Timing
 
+# Unsolicited frames kept until read, the oldest are dropped beyond
+INBOX_SIZE = 256
 
-class PREAMBLE:
-    SEND = b"$M<"
-    RECV = b"$M>"
+
+class BatchTimeout(TimeoutError):
+    """
+    Raised by MultiWii.invoke_many() when some replies missed the deadline.
+    Replies that did arrive are still available in `results`.
+    """
+
+    def __init__(self, results: list, missing: list[ReadCMD]):
+        names = ", ".join(cmd.__class__.__name__ for cmd in missing)
+        super().__init__(f"no reply before deadline for {names}")
+        self.results = results
+        self.missing = missing
+
+
+class RequestTimeout(TimeoutError):
+    """
+    Raised by MultiWii.request() (and invoke) when no reply arrived after
+    every attempt.
+    """
+
+    def __init__(self, code: int, attempts: int):
+        CMD = COMMANDS.get(code)
+        name = CMD.__name__ if CMD is not None else str(code)
+        super().__init__(f"no reply to {name} after {attempts} attempt(s)")
+        self.code = code
+        self.attempts = attempts
 
 
 class MultiWii:
-    def __init__(self, path: str = None, baud: int = 115200, timeout: float = 0.1):
-        if path is None:
-            path = glob.glob("/dev/ttyACM*")[0]
-            print(f"Using serial device {path}")
-        self.serial = serial.Serial(path, baud, timeout=timeout)
-
-    def __get_byte__(self):
-        read_result = list(self.serial.read())
-        if len(read_result) == 0:
-            # Timeout triggerred, no data received
-            return None
-        return U8(read_result[0])
+    # (code, payload) of received frames nobody was waiting for, in
+    # arrival order
+    inbox: deque[tuple[int, bytes]]
+    # Callbacks (direction, code, payload) invoked for every frame on the link
+    hooks: list
+    # Optional cache of configuration reads (see lib/Cache.py)
+    cache: ResponseCache | None
+    # Optional link instrumentation (see lib/Metrics.py)
+    metrics: LinkMetrics | None
+
+    serial: Transport
+    # Adaptive deadline of read requests (see lib/Timeout.py)
+    rtt: RTTEstimator
+    # Extra attempts of a read request before giving up
+    retries: int
+    # Acquisition time of replies (see lib/Clock.py)
+    clock: SampleClock
+
+    def __init__(
+        self,
+        path: str = None,
+        baud: int = 115200,
+        timeout: float = 0.1,
+        transport: Transport = None,
+        protocol: int = None,
+        retries: int = 2,
+        reconnect: bool = True,
+        max_payload: int = MAX_V2_PAYLOAD,
+    ):
+        # path: serial device, or "tcp://host:port" / "unix:///path" socket
+        # protocol: 1 (MSP v1), 2 (MSP v2) or None to auto-detect
+        # timeout: initial request deadline, adapted to the measured RTT
+        # reconnect: reopen the serial port when the device comes back
+        # max_payload: largest MSP v2 reply accepted (see lib/Stream.py)
+        if transport is None and path is not None and "://" in path:
+            # Socket address, e.g. a bridge sharing the serial port
+            transport = SocketTransport.connect(path, timeout)
+        if transport is None:
+            if reconnect:
+                transport = ReconnectingSerial(path, baud, timeout)
+            else:
+                transport = open_serial(path, baud, timeout)
+        self.serial = transport
+        self.rtt = RTTEstimator(timeout, getattr(transport, "baudrate", None))
+        self.retries = retries
+        self.parser = FrameParser(PREAMBLE.RECV, protocol, max_payload)
+        self.clock = SampleClock(self.rtt.baudrate)
+        self.parser.byte_time = self.clock.wire_time(1)
+        self.protocol = protocol
+        self.inbox = deque(maxlen=INBOX_SIZE)
+        self.hooks = []
+        self.cache = None
+        self.metrics = None
+        if isinstance(transport, ReconnectingSerial):
+            transport.callbacks.append(self.__reconnected__)
+
+    def __reconnected__(self):
+        # The device may have rebooted: partial frames and link history
+        # gathered before the dropout no longer apply
+        self.parser.reset()
+        self.rtt.reset()
+        self.clock.reset()
+
+    def __emit__(self, code: int, buffer: bytes = b"") -> bytes:
+        # Compose an outgoing frame and report it to the hooks
+        for hook in self.hooks:
+            hook(DIRECTION.SEND, code, buffer)
+        version = pickVersion(self.protocol, code, len(buffer), self.parser.version)
+        return frame(code, buffer, version)
 
     def __send__(self, code: int, buffer: bytes = b""):
-        CODE = U8(code)
-        SIZE = U8(len(buffer))
-        checksum = SIZE ^ CODE
-        for x in buffer:
-            checksum ^= x
-        checksum = U8(checksum)
         # Compose and send command
-        self.serial.write(
-            PREAMBLE.SEND + SIZE.bytes + CODE.bytes + buffer + checksum.bytes
+        data = self.__emit__(code, buffer)
+        self.serial.write(data)
+        if self.metrics is not None:
+            self.metrics.sent(len(data))
+
+    def __recv__(self) -> tuple[int, bytes]:
+        # Frames with bad checksums are dropped and counted by the parser
+        frame = self.parser.read(self.serial)
+        if frame is None:
+            # Timeout triggerred, no data received
+            return None, None
+        for hook in self.hooks:
+            hook(DIRECTION.RECV, *frame)
+        return frame
+
+    def __drain__(self):
+        # Frames already received, without blocking
+        waiting = self.serial.in_waiting
+        if waiting:
+            self.parser.feed(self.serial.read(waiting))
+        for frame in self.parser:
+            for hook in self.hooks:
+                hook(DIRECTION.RECV, *frame)
+            yield frame
+
+    def sender(self, CMD: type[WriteCMD], *args, **kwargs) -> FrameSender:
+        # Preallocated frame for streaming one write command at high rate
+        return FrameSender(self, CMD, *args, **kwargs)
+
+    def __clamp__(self, remaining: float):
+        # Keep a blocking read within the remaining time of a deadline. Only
+        # touch the port setting when it is off, since reconfiguring a real
+        # serial port is not free.
+        current = self.serial.timeout
+        if current is None or not remaining / 2 <= current <= remaining:
+            self.serial.timeout = remaining
+
+    def __wait__(self, code: int, deadline: float) -> bytes | None:
+        # Payload of the first reply to code, None once the deadline passed
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            self.__clamp__(remaining)
+            reply, data = self.__recv__()
+            if reply == code:
+                return data
+            elif reply is not None:
+                self.inbox.append((reply, data))
+
+    def request(self, code: int, query: bytes = b"") -> bytes:
+        """
+        Raw round-trip: send a read request and return the undecoded payload.
+        Each attempt waits for the wire time of both frames plus the RTT
+        margin, raises RequestTimeout after 1 + retries attempts.
+        """
+        return self.__request__(code, query)[0]
+
+    def __request__(self, code: int, query: bytes = b"") -> tuple[bytes, Timing]:
+        # Payload of the reply and its timing
+        for attempt in range(self.retries + 1):
+            sent, start, deadline = self.__attempt__(code, query)
+            data = self.__wait__(code, deadline)
+            if data is not None:
+                return data, self.__replied__(code, query, sent, start, attempt)
+            self.__missed__(code)
+        raise RequestTimeout(code, self.retries + 1)
+
+    # Steps of one read request, shared with readers that do not block on
+    # the reply (see lib/Scheduler.py)
+
+    @staticmethod
+    def __size__(code: int, query: bytes = b"") -> int:
+        # Bytes on the wire for the request and its reply
+        CMD = COMMANDS.get(code)
+        return 2 * FRAME_OVERHEAD + len(query) + (CMD.size if CMD is not None else 0)
+
+    def __attempt__(
+        self, code: int, query: bytes = b"", backlog: int = 0
+    ) -> tuple[float, float, float]:
+        """
+        Send one attempt of a read request. Returns the time it was sent
+        (time.monotonic and time.perf_counter) and the perf_counter deadline
+        of its reply. backlog: bytes of other replies due before this one.
+        """
+        sent = time.monotonic()
+        start = time.perf_counter()
+        self.__send__(code, query)
+        return (
+            sent,
+            start,
+            start + self.rtt.timeout(self.__size__(code, query) + backlog),
         )
 
-    def __recv__(self) -> tuple[U8, bytes]:
-        # Match preamble
-        preamble = 0
-        while preamble < len(PREAMBLE.RECV):
-            byte = self.__get_byte__()
-            if byte is None:
-                return None, None
-            if byte == PREAMBLE.RECV[preamble]:
-                preamble += 1
-            else:
-                preamble = 0
-        # Decode header
-        SIZE = self.__get_byte__()
-        CODE = self.__get_byte__()
-        # Buffer packet body
-        DATA = self.serial.read(SIZE)
-        # Decode checksum
-        checksum = self.__get_byte__()
-        # Verify checksum
-        for x in [SIZE, CODE, *DATA]:
-            checksum ^= x
-        assert checksum == 0, f"Checksum failed for command {CODE}"
-        # Return all fields
-        return CODE, DATA
-
-    def invoke(self, command: ReadCMD | WriteCMD) -> dict | None:
+    def __replied__(
+        self,
+        code: int,
+        query: bytes,
+        sent: float,
+        start: float,
+        attempt: int,
+        sample: bool = True,
+    ) -> Timing:
+        # Account for the reply to an attempt (just parsed) and return its
+        # timing. Replies that could have waited behind others are no
+        # latency samples (sample=False).
+        sample = sample and attempt == 0
+        timing = self.clock.timing(
+            sent, FRAME_OVERHEAD + len(query), self.parser.stamp, sample
+        )
+        elapsed = time.perf_counter() - start
+        if sample:
+            self.rtt.sample(elapsed, self.__size__(code, query))
+        elif attempt:
+            # Replies to retried requests are ambiguous (Karn)
+            self.rtt.settle()
+        if self.metrics is not None:
+            self.metrics.observe(code, elapsed)
+        return timing
+
+    def __missed__(self, code: int):
+        # An attempt got no reply before its deadline
+        self.rtt.backoff()
+        if self.metrics is not None:
+            self.metrics.timeout(code)
+
+    def __cached__(self, command: ReadCMD) -> bytes | None:
+        # Cached payload if the command is cached and the entry is fresh
+        if self.cache is None or command.code not in self.cache.policy:
+            return None
+        return self.cache.get(command)
+
+    def __store__(self, command: ReadCMD, data: bytes):
+        if self.cache is not None and command.code in self.cache.policy:
+            self.cache.put(command, data)
+
+    def __written__(self, command: WriteCMD):
+        if self.cache is not None:
+            self.cache.written(command)
+
+    def __decode__(self, command: ReadCMD, data: bytes, timing: Timing) -> Response:
+        response = command.fromBytes(data, timing)
+        if timing is not None:
+            self.clock.update(response)
+        return response
+
+    def __received__(self, command: ReadCMD, data: bytes, timing: Timing) -> Response:
+        # Reply of the link: cache it and decode it
+        self.__store__(command, data)
+        return self.__decode__(command, data, timing)
+
+    def refresh(self, command: ReadCMD) -> Response:
+        # Round-trip regardless of the cache, and update the cached entry
+        data, timing = self.__request__(command.code, command.query)
+        return self.__received__(command, data, timing)
+
+    def invoke(
+        self, command: ReadCMD | WriteCMD, fields: str | tuple = None
+    ) -> Response | tuple | None:
+        # Replies are lazily decoded records (with their timing, None if
+        # cached), or only the projected fields
         if isinstance(command, ReadCMD):
-            self.__send__(command.code)
-            while True:
-                code, data = self.__recv__()
-                if code == command.code:
-                    return command.fromBytes(data)
+            data, timing = self.__cached__(command), None
+            if data is None:
+                data, timing = self.__request__(command.code, command.query)
+                self.__store__(command, data)
+            if fields is not None:
+                return command.project(data, fields)
+            return self.__decode__(command, data, timing)
         elif isinstance(command, WriteCMD):
             self.__send__(command.code, command.toBytes())
+            self.__written__(command)
         else:
             raise TypeError
         return None
+
+    def frames(self, timeout: float = None):
+        """
+        Yield (code, command class, value) for every incoming frame, decoded
+        through the command registry (see Command.Registry.decode): replies
+        of known reads are CMD.Response records, like invoke() returns.
+        Frames already waiting in the inbox come first. Stops once no frame
+        arrived for `timeout` seconds, runs forever if timeout is None.
+        """
+        while self.inbox:
+            code, data = self.inbox.popleft()
+            yield code, COMMANDS.get(code), COMMANDS.decode(code, data)
+        last = time.monotonic()
+        while timeout is None or (remaining := last + timeout - time.monotonic()) > 0:
+            if timeout is not None:
+                self.__clamp__(remaining)
+            code, data = self.__recv__()
+            if code is None:
+                continue
+            last = time.monotonic()
+            yield code, COMMANDS.get(code), COMMANDS.decode(code, data)
+
+    def invoke_many(
+        self, commands: list[ReadCMD | WriteCMD], timeout: float = 1.0
+    ) -> list[Response | None]:
+        """
+        Send all commands in a single write, then collect the replies of
+        every ReadCMD as they arrive (in any order) until the deadline.
+        Results are returned in the order of the given commands.
+        Cached reads are answered locally and are not sent.
+        """
+        results = [None] * len(commands)
+        pending: dict[int, list[int]] = {}
+        frames = []
+        # Bytes written up to the end of each read request
+        written, until = 0, {}
+        for index, command in enumerate(commands):
+            if isinstance(command, ReadCMD):
+                data = self.__cached__(command)
+                if data is not None:
+                    results[index] = command.fromBytes(data)
+                    continue
+                frames.append(self.__emit__(command.code, command.query))
+                written += len(frames[-1])
+                until[index] = written
+                pending.setdefault(command.code, []).append(index)
+            elif isinstance(command, WriteCMD):
+                frames.append(self.__emit__(command.code, command.toBytes()))
+                written += len(frames[-1])
+                self.__written__(command)
+            else:
+                raise TypeError
+        sent = time.monotonic()
+        start = time.perf_counter()
+        if frames:
+            data = b"".join(frames)
+            self.serial.write(data)
+            if self.metrics is not None:
+                self.metrics.sent(len(data), len(frames))
+        deadline = time.monotonic() + timeout
+        while pending and (remaining := deadline - time.monotonic()) > 0:
+            self.__clamp__(remaining)
+            code, data = self.__recv__()
+            if code in pending:
+                waiting = pending[code]
+                index = waiting.pop(0)
+                if not waiting:
+                    del pending[code]
+                if self.metrics is not None:
+                    self.metrics.observe(code, time.perf_counter() - start)
+                # Replies queue behind each other, not a latency sample
+                stamp = self.parser.stamp
+                timing = self.clock.timing(sent, until[index], stamp, sample=False)
+                results[index] = self.__received__(commands[index], data, timing)
+            elif code is not None:
+                self.inbox.append((code, data))
+        if pending:
+            missing = [commands[i] for waiting in pending.values() for i in waiting]
+            if self.metrics is not None:
+                for command in missing:
+                    self.metrics.timeout(command.code)
+            raise BatchTimeout(results, missing)
+        return results
@@ -0,0 +1,166 @@
+# ===================================================================
+# Background telemetry poller with per-command rate scheduling
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   poller = Poller(fc, {MSP.ATTITUDE: 100, MSP.ANALOG: 5, MSP.IDENT: 0})
+#   poller.start()
+#   poller.latest(MSP.ATTITUDE)  # -> Sample(time, value) or None
+# A rate of 0 (or None) polls the command once.
+# The poller owns the MultiWii link while running: other threads should
+# read from the snapshot instead of invoking commands themselves.
+# ===================================================================
+import threading, time
+from typing import NamedTuple
+from .Command import ReadCMD
+from .Response import Response
+from .MultiWii import MultiWii, BatchTimeout
+from .Timeout import BITS_PER_BYTE, FRAME_OVERHEAD
+
+
+class Sample(NamedTuple):
+    time: float
+    value: Response
+
+
+class PollStats:
+    period: float
+    samples: int
+    dropped: int
+    # Running mean / variance of the interval between samples (Welford)
+    mean_interval: float
+    __m2__: float
+
+    def __init__(self, period: float):
+        self.period = period
+        self.samples = 0
+        self.dropped = 0
+        self.mean_interval = 0.0
+        self.__m2__ = 0.0
+        self.first = self.last = None
+
+    def record(self, timestamp: float):
+        if self.last is not None:
+            interval = timestamp - self.last
+            n = self.samples  # number of intervals so far, including this one
+            delta = interval - self.mean_interval
+            self.mean_interval += delta / n
+            self.__m2__ += delta * (interval - self.mean_interval)
+        else:
+            self.first = timestamp
+        self.last = timestamp
+        self.samples += 1
+
+    @property
+    def rate(self) -> float:
+        # Achieved rate in Hz
+        if self.samples < 2:
+            return 0.0
+        return (self.samples - 1) / (self.last - self.first)
+
+    @property
+    def jitter(self) -> float:
+        # Standard deviation of the interval between samples, in seconds
+        if self.samples < 3:
+            return 0.0
+        return (self.__m2__ / (self.samples - 2)) ** 0.5
+
+    def __repr__(self):
+        return (
+            f"PollStats(rate={self.rate:.1f}Hz, jitter={self.jitter * 1e3:.2f}ms, "
+            f"samples={self.samples}, dropped={self.dropped})"
+        )
+
+
+class Poller(threading.Thread):
+    fc: MultiWii
+    schedule: dict[type[ReadCMD], float]
+    stats: dict[type[ReadCMD], PollStats]
+    # Latest sample of every command. Entries are replaced (never mutated)
+    # so readers need no lock.
+    snapshot: dict[type[ReadCMD], Sample]
+
+    def __init__(
+        self,
+        fc: MultiWii,
+        schedule: dict[type[ReadCMD], float],
+        timeout: float = 0.1,
+    ):
+        super().__init__(daemon=True)
+        self.fc = fc
+        self.timeout = timeout
+        self.schedule = dict(schedule)
+        self.commands = {CMD: CMD() for CMD in self.schedule}
+        self.stats = {
+            CMD: PollStats(1.0 / rate if rate else 0.0)
+            for CMD, rate in self.schedule.items()
+        }
+        self.snapshot = {}
+        self.__stop_event__ = threading.Event()
+        # Bytes the link can carry per second, in both directions. Sockets
+        # and simulators have no baudrate: the whole batch fits.
+        baudrate = getattr(fc.serial, "baudrate", None)
+        self.bandwidth = baudrate / BITS_PER_BYTE if baudrate else float("inf")
+
+    def latest(self, CMD: type[ReadCMD]) -> Sample | None:
+        return self.snapshot.get(CMD)
+
+    def stop(self):
+        self.__stop_event__.set()
+
+    @staticmethod
+    def cost(CMD: type[ReadCMD]) -> int:
+        # Bytes on the wire for one request / response round
+        return FRAME_OVERHEAD + FRAME_OVERHEAD + CMD.size
+
+    def __batch__(self, due: list[type[ReadCMD]], deadline: dict) -> list:
+        # Earliest deadline first, as many as fit in one time slice of the
+        # shortest configured period (at least one command)
+        due.sort(key=deadline.__getitem__)
+        periods = [s.period for s in self.stats.values() if s.period]
+        budget = self.bandwidth * (min(periods) if periods else 1.0)
+        batch, used = [], 0
+        for CMD in due:
+            used += self.cost(CMD)
+            if batch and used > budget:
+                break
+            batch.append(CMD)
+        return batch
+
+    def run(self):
+        now = time.monotonic()
+        deadline = {CMD: now for CMD in self.schedule}
+        while deadline and not self.__stop_event__.is_set():
+            now = time.monotonic()
+            due = [CMD for CMD, t in deadline.items() if t <= now]
+            if not due:
+                self.__stop_event__.wait(min(deadline.values()) - now)
+                continue
+            batch = self.__batch__(due, deadline)
+            try:
+                results = self.fc.invoke_many(
+                    [self.commands[CMD] for CMD in batch], self.timeout
+                )
+            except BatchTimeout as e:
+                results = e.results
+            timestamp = time.monotonic()
+            for CMD, value in zip(batch, results):
+                stats = self.stats[CMD]
+                if value is None:
+                    stats.dropped += 1
+                else:
+                    self.snapshot[CMD] = Sample(timestamp, value)
+                    stats.record(timestamp)
+                if not stats.period:
+                    if value is not None:
+                        # One-shot command done
+                        del deadline[CMD]
+                    continue
+                deadline[CMD] += stats.period
+                if deadline[CMD] < timestamp:
+                    # Fell behind: skip the missed slots instead of bursting
+                    missed = int((timestamp - deadline[CMD]) / stats.period) + 1
+                    stats.dropped += missed
+                    deadline[CMD] += missed * stats.period
@@ -0,0 +1,117 @@
+# ===================================================================
+# Fixed-memory telemetry recorder backed by NumPy structured arrays
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Requires numpy (optional dependency of this package).
+# Each command gets a packed structured dtype mirroring its wire layout,
+# prefixed by a float64 monotonic timestamp. Payloads are copied straight
+# into a preallocated ring buffer, no dict is ever built.
+# Usage:
+#   rec = Recorder({MSP.RAW_IMU: 360000, MSP.ATTITUDE: 360000})
+#   rec.sample(fc, MSP.RAW_IMU)       # request and record one frame
+#   older, newer = rec[MSP.RAW_IMU].views()
+#   rec[MSP.RAW_IMU].ordered()["accX"]
+# ===================================================================
+import time
+import numpy as np
+from .ByteCode import TypedInteger, Record, Repeated, isScalar
+from .Command import MSP_Command, ReadCMD
+from .MultiWii import MultiWii
+
+TIME_FIELD = "time"
+
+
+def field_dtype(dtype: type[TypedInteger] | Record | Repeated) -> np.dtype:
+    if isScalar(dtype):
+        kind = "i" if dtype.signed else "u"
+        return np.dtype(f"<{kind}{dtype.byte_size}")
+    if isinstance(dtype, Record):
+        return np.dtype([(k, field_dtype(t)) for k, t in dtype.fields.items()])
+    if isinstance(dtype, Repeated) and dtype.fixed:
+        return np.dtype((field_dtype(dtype.item), (dtype.count,)))
+    raise TypeError(f"variable length {type(dtype).__name__} has no fixed dtype")
+
+
+def payload_dtype(CMD: type[MSP_Command]) -> np.dtype:
+    # Packed (unaligned) dtype with exactly the same layout as the payload
+    return np.dtype([(str(key), field_dtype(t)) for key, t in CMD.struct.items()])
+
+
+def record_dtype(CMD: type[MSP_Command]) -> np.dtype:
+    return np.dtype(
+        [(TIME_FIELD, np.float64)]
+        + [(str(key), field_dtype(t)) for key, t in CMD.struct.items()]
+    )
+
+
+class Ring:
+    CMD: type[ReadCMD]
+    buffer: np.ndarray
+    capacity: int
+    # Total number of records ever appended
+    count: int
+
+    def __init__(self, CMD: type[ReadCMD], capacity: int):
+        self.CMD = CMD
+        self.capacity = capacity
+        self.count = 0
+        self.buffer = np.zeros(capacity, dtype=record_dtype(CMD))
+        # Byte level views used to copy payloads without decoding
+        rows = self.buffer.view(np.uint8).reshape(capacity, self.buffer.itemsize)
+        self.__payload__ = rows[:, np.dtype(np.float64).itemsize :]
+        self.__time__ = self.buffer[TIME_FIELD]
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, payload: bytes, timestamp: float = None):
+        assert (
+            len(payload) == self.CMD.size
+        ), f"payload size mismatch for {self.CMD.__name__} (got {len(payload)} bytes)"
+        index = self.count % self.capacity
+        self.__payload__[index] = memoryview(payload)
+        self.__time__[index] = time.monotonic() if timestamp is None else timestamp
+        self.count += 1
+
+    def views(self) -> tuple[np.ndarray, np.ndarray]:
+        # Zero-copy (older, newer) slices, in chronological order
+        head = self.count % self.capacity
+        if self.count <= self.capacity:
+            return self.buffer[:head], self.buffer[:0]
+        return self.buffer[head:], self.buffer[:head]
+
+    def ordered(self) -> np.ndarray:
+        # Chronological copy of the whole ring
+        older, newer = self.views()
+        if not len(newer):
+            return older.copy()
+        return np.concatenate((older, newer))
+
+    def latest(self) -> np.void | None:
+        if self.count == 0:
+            return None
+        return self.buffer[(self.count - 1) % self.capacity]
+
+
+class Recorder:
+    rings: dict[int, Ring]
+
+    def __init__(self, capacity: dict[type[ReadCMD], int]):
+        self.rings = {CMD.code: Ring(CMD, n) for CMD, n in capacity.items()}
+
+    def __getitem__(self, CMD: type[ReadCMD]) -> Ring:
+        return self.rings[CMD.code]
+
+    def record(self, code: int, payload: bytes, timestamp: float = None) -> bool:
+        # Store a raw frame, returns False if the code is not recorded
+        ring = self.rings.get(code)
+        if ring is None:
+            return False
+        ring.append(payload, timestamp)
+        return True
+
+    def sample(self, fc: MultiWii, CMD: type[ReadCMD]):
+        payload = fc.request(CMD.code)
+        self.rings[CMD.code].append(payload)
@@ -0,0 +1,121 @@
+# ===================================================================
+# Lazily decoded reply records
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Every ReadCMD gets a generated Response subclass (CMD.Response) that
+# keeps a reference to the raw payload and decodes a field only when it
+# is accessed. It behaves as a read-only mapping:
+#   rc = fc.invoke(MSP.RC())
+#   rc.THROTTLE, rc["THROTTLE"]         # decodes 2 bytes
+#   rc.to_dict()                        # every field, as a plain dict
+# Projections decode a fixed selection of fields straight into a tuple:
+#   roll, pitch = fc.invoke(MSP.ATTITUDE(), fields=("angx", "angy"))
+# ===================================================================
+from collections.abc import Mapping
+from operator import itemgetter
+from struct import Struct
+from .ByteCode import STRUCT_ENDIAN, isScalar
+
+
+def getters(CMD) -> dict:
+    # key -> function(payload) decoding that single field
+    result, offset = {}, 0
+    for key, dtype in CMD.struct.items():
+        if not dtype.fixed:
+            # Variable-length tail, always the last field
+            result[key] = lambda buffer, o=offset, decode=dtype.decode: decode(
+                memoryview(buffer)[o:]
+            )
+            break
+        unpack = Struct(STRUCT_ENDIAN + dtype.fmt()).unpack_from
+        if isScalar(dtype):
+            result[key] = lambda buffer, o=offset, u=unpack: u(buffer, o)[0]
+        else:
+            result[key] = lambda buffer, o=offset, u=unpack, make=dtype.fromValues: (
+                make(u(buffer, o))
+            )
+        offset += dtype.byte_size
+    return result
+
+
+def projector(CMD, fields: str | tuple):
+    """
+    Function(payload) returning one field (fields is a key) or a tuple of
+    fields. Scalar-only selections compile into a single struct with pad
+    bytes over the unused parts of the payload.
+    """
+    if not isinstance(fields, tuple):
+        return CMD.Response.getters[fields]
+    layout, offsets, offset = {}, {}, 0
+    for key, dtype in CMD.struct.items():
+        if not dtype.fixed:
+            break
+        layout[key], offsets[key] = dtype, offset
+        offset += dtype.byte_size
+    if not all(key in layout and isScalar(layout[key]) for key in fields):
+        get = [CMD.Response.getters[key] for key in fields]
+        return lambda buffer: tuple(g(buffer) for g in get)
+    fmt, position = STRUCT_ENDIAN, 0
+    selected = sorted(set(fields), key=offsets.__getitem__)
+    for key in selected:
+        fmt += "x" * (offsets[key] - position) + layout[key].fmt()
+        position = offsets[key] + layout[key].byte_size
+    unpack = Struct(fmt).unpack_from
+    if list(fields) == selected:
+        return unpack
+    reorder = itemgetter(*(selected.index(key) for key in fields))
+    if len(fields) == 1:
+        return lambda buffer: (reorder(unpack(buffer)),)
+    return lambda buffer: reorder(unpack(buffer))
+
+
+class Response(Mapping):
+    # Reply of one ReadCMD, fields are decoded on access
+    __slots__ = ("payload", "timing")
+    CMD: type
+    getters: dict
+    # Arrival and acquisition time (see lib/Clock.py), None if not received
+    # from the link (e.g. cached)
+    timing: "Timing | None"
+
+    def __init__(self, payload: bytes, timing: "Timing" = None):
+        CMD, size = self.CMD, len(payload)
+        assert (
+            size >= CMD.size
+        ), f"insufficient buffer for {CMD.__name__} (got {size} bytes)"
+        if CMD.tail is None:
+            assert size == CMD.size, f"excess buffer for {CMD.__name__}"
+        self.payload = payload
+        self.timing = timing
+
+    def __getitem__(self, key):
+        return self.getters[key](self.payload)
+
+    def __iter__(self):
+        return iter(self.getters)
+
+    def __len__(self) -> int:
+        return len(self.getters)
+
+    def to_dict(self) -> dict:
+        return self.CMD.decode(self.payload)
+
+    def __repr__(self) -> str:
+        return f"{self.CMD.__name__}({self.to_dict()})"
+
+
+def responseType(CMD) -> type[Response]:
+    namespace = {
+        "__slots__": (),
+        "__module__": CMD.__module__,
+        "__qualname__": f"{CMD.__name__}.Response",
+        "CMD": CMD,
+        "getters": getters(CMD),
+    }
+    for key, get in namespace["getters"].items():
+        # Attribute access for identifier keys that do not shadow a method
+        if isinstance(key, str) and key.isidentifier() and not hasattr(Response, key):
+            namespace[key] = property(lambda self, get=get: get(self.payload))
+    return type("Response", (Response,), namespace)
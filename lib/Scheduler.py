@@ -0,0 +1,320 @@
+# ===================================================================
+# Priority send queue with latest-value-wins coalescing
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   scheduler = Scheduler(fc)
+#   scheduler.start()
+#   scheduler.submit(MSP.SET_RAW_RC(1500, 1500, 1500, 1200))  # CONTROL
+#   future = scheduler.submit(MSP.ATTITUDE())                  # TELEMETRY
+#   future.result()
+#   scheduler.depth(), scheduler.age[MSP.SET_RAW_RC.code]      # observability
+# Commands leave the queue by priority class (CONTROL, then CONFIG, then
+# TELEMETRY), first come first served within a class. A command is only
+# taken once the previous frames had time to leave the wire at the port's
+# baud rate, so everything not sent yet can still be reordered, and a new
+# setpoint of a coalescing command (SET_RAW_RC, SET_MOTOR, ...) replaces
+# the pending one instead of queueing behind it.
+# Reads do not hold the link: the request is sent and its reply picked
+# up from the port between later sends, so a setpoint submitted while a
+# read is in flight still goes out right away. Replies only carry the
+# code, so a read of a code already in flight with other arguments waits
+# for it, and one with the same arguments shares its reply. Retries and
+# timeouts follow MultiWii.request().
+# Like the Poller, the scheduler owns the link while running.
+# ===================================================================
+import heapq, threading, time
+from concurrent.futures import CancelledError, Future
+from . import MSP
+from .Command import MSP_Command, ReadCMD, WriteCMD
+from .Metrics import Histogram
+from .MultiWii import MultiWii, RequestTimeout
+from .Timeout import FRAME_OVERHEAD
+
+# Priority classes, lower is sent first
+CONTROL = 0
+CONFIG = 1
+TELEMETRY = 2
+# Setpoints: only the latest value matters
+SETPOINTS = (MSP.SET_RAW_RC, MSP.SET_MOTOR, MSP.SET_HEAD, MSP.SET_RAW_GPS)
+# Setpoint age buckets, in seconds
+AGE_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5)
+# Seconds between checks of the port while replies are awaited
+POLL_INTERVAL = 0.001
+
+
+def classify(command: MSP_Command) -> int:
+    # Default priority class of a command
+    if isinstance(command, ReadCMD):
+        return TELEMETRY
+    if isinstance(command, SETPOINTS):
+        return CONTROL
+    return CONFIG
+
+
+class Entry:
+    __slots__ = ("command", "time", "future")
+
+    def __init__(self, command: MSP_Command, future: Future | None):
+        self.command = command
+        # Submission time of the (latest) command
+        self.time = time.monotonic()
+        self.future = future
+
+
+class Read:
+    __slots__ = ("command", "futures", "attempt", "sent", "start", "deadline", "shared")
+
+    def __init__(self, command: ReadCMD, future: Future):
+        self.command = command
+        # Callers sharing the reply
+        self.futures = [future]
+        self.attempt = 0
+        # Time of the latest attempt (monotonic and perf_counter) and the
+        # perf_counter deadline of its reply (see MultiWii.__attempt__)
+        self.sent = self.start = 0.0
+        self.deadline = 0.0
+        # Other replies were due at the same time: not a latency sample
+        self.shared = False
+
+
+class Scheduler(threading.Thread):
+    # Heap of (priority, sequence, entry)
+    queue: list
+    # Write code -> its pending entry, for coalescing commands
+    pending: dict[int, Entry]
+    # Read code -> its request in flight
+    reads: dict[int, Read]
+    # Read code -> queue items waiting for the read of that code in flight
+    held: dict[int, list]
+    # Command code -> time spent in the queue until sent (latest value)
+    age: dict[int, Histogram]
+    # Counters
+    sent: int
+    coalesced: int
+    # Writes lost to link errors
+    errors: int
+
+    def __init__(
+        self,
+        fc: MultiWii,
+        coalesce: tuple[type[WriteCMD], ...] = SETPOINTS,
+        priority: dict[type[MSP_Command], int] = None,
+    ):
+        super().__init__(daemon=True)
+        self.fc = fc
+        self.coalesce = {CMD.code for CMD in coalesce}
+        self.priority = {CMD.code: p for CMD, p in (priority or {}).items()}
+        self.queue = []
+        self.pending = {}
+        self.reads = {}
+        self.held = {}
+        self.age = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.sequence = 0
+        self.busy_until = 0.0
+        self.cond = threading.Condition()
+        self.__stop_event__ = threading.Event()
+
+    def submit(self, command: MSP_Command, priority: int = None) -> Future | None:
+        # Reads return a Future of the reply, writes return None
+        if priority is None:
+            priority = self.priority.get(command.code)
+        if priority is None:
+            priority = classify(command)
+        with self.cond:
+            entry = self.pending.get(command.code)
+            if entry is not None:
+                # Latest value wins, keeps the place of the pending one
+                entry.command = command
+                entry.time = time.monotonic()
+                self.coalesced += 1
+                return None
+            future = Future() if isinstance(command, ReadCMD) else None
+            entry = Entry(command, future)
+            if command.code in self.coalesce and future is None:
+                self.pending[command.code] = entry
+            heapq.heappush(self.queue, (priority, self.sequence, entry))
+            self.sequence += 1
+            self.cond.notify()
+        return future
+
+    def depth(self, priority: int = None) -> int:
+        # Number of queued commands, optionally of one priority class
+        with self.cond:
+            items = [item for held in self.held.values() for item in held]
+            items += self.queue
+            if priority is None:
+                return len(items)
+            return sum(1 for p, _, _ in items if p == priority)
+
+    def stop(self):
+        self.__stop_event__.set()
+        with self.cond:
+            self.cond.notify()
+
+    def __take__(self, timeout: float = None) -> Entry | None:
+        # Next entry once the link is free, None when stopped or after
+        # timeout seconds without one
+        with self.cond:
+            end = None if timeout is None else time.monotonic() + timeout
+            while not self.__stop_event__.is_set():
+                now = time.monotonic()
+                wait = self.busy_until - now
+                if self.queue and wait <= 0:
+                    item = heapq.heappop(self.queue)
+                    entry = item[2]
+                    command = entry.command
+                    if self.pending.get(command.code) is entry:
+                        del self.pending[command.code]
+                    read = self.reads.get(command.code)
+                    if read is None or entry.future is None:
+                        return entry
+                    if read.command.query == command.query:
+                        return entry
+                    # Reply would be ambiguous, wait for the one in flight
+                    self.held.setdefault(command.code, []).append(item)
+                    continue
+                if end is not None:
+                    if now >= end:
+                        return None
+                    wait = min(wait, end - now) if self.queue else end - now
+                elif not self.queue:
+                    wait = None
+                self.cond.wait(wait)
+        return None
+
+    def __record__(self, entry: Entry, now: float):
+        code = entry.command.code
+        histogram = self.age.get(code)
+        if histogram is None:
+            histogram = self.age[code] = Histogram(AGE_BUCKETS)
+        histogram.observe(now - entry.time)
+        self.sent += 1
+
+    def __request__(self, read: Read):
+        # Send one attempt of a read, without waiting for the reply
+        command, fc = read.command, self.fc
+        # Replies still due come first on the way back
+        backlog = sum(
+            FRAME_OVERHEAD + other.command.size
+            for other in self.reads.values()
+            if other is not read
+        )
+        read.shared = backlog > 0
+        try:
+            read.sent, read.start, read.deadline = fc.__attempt__(
+                command.code, command.query, backlog
+            )
+        except OSError as e:
+            self.__finish__(read, exception=e)
+            return
+        wire = fc.rtt.wire_time(FRAME_OVERHEAD + len(command.query))
+        self.busy_until = read.sent + wire
+
+    def __finish__(self, read: Read, result=None, exception: Exception = None):
+        code = read.command.code
+        if self.reads.get(code) is read:
+            del self.reads[code]
+        for future in read.futures:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+        with self.cond:
+            for item in self.held.pop(code, ()):
+                heapq.heappush(self.queue, item)
+
+    def __reply__(self, read: Read, data: bytes):
+        command, fc = read.command, self.fc
+        timing = fc.__replied__(
+            command.code,
+            command.query,
+            read.sent,
+            read.start,
+            read.attempt,
+            not read.shared,
+        )
+        self.__finish__(read, fc.__received__(command, data, timing))
+
+    def __poll__(self):
+        # Dispatch whatever arrived on the port, without blocking
+        for code, data in self.fc.__drain__():
+            read = self.reads.get(code)
+            if read is not None:
+                self.__reply__(read, data)
+            else:
+                self.fc.inbox.append((code, data))
+
+    def __expire__(self):
+        # Retry or fail reads whose reply is overdue
+        now, fc = time.perf_counter(), self.fc
+        for read in [read for read in self.reads.values() if read.deadline <= now]:
+            fc.__missed__(read.command.code)
+            if read.attempt < fc.retries:
+                read.attempt += 1
+                self.__request__(read)
+            else:
+                error = RequestTimeout(read.command.code, read.attempt + 1)
+                self.__finish__(read, exception=error)
+
+    def __write__(self, entry: Entry, now: float):
+        command = entry.command
+        try:
+            self.fc.invoke(command)
+        except OSError:
+            # This value is lost, the next one may find the link back
+            self.errors += 1
+            return
+        size = FRAME_OVERHEAD + command.size
+        if command.tail is not None:
+            size = FRAME_OVERHEAD + len(command.toBytes())
+        self.busy_until = now + self.fc.rtt.wire_time(size)
+
+    def __read__(self, entry: Entry):
+        command = entry.command
+        if not entry.future.set_running_or_notify_cancel():
+            return
+        data = self.fc.__cached__(command)
+        if data is not None:
+            entry.future.set_result(command.fromBytes(data))
+            return
+        read = self.reads.get(command.code)
+        if read is not None:
+            # Same arguments (see __take__), share the reply
+            read.futures.append(entry.future)
+            return
+        read = self.reads[command.code] = Read(command, entry.future)
+        self.__request__(read)
+
+    def run(self):
+        while not self.__stop_event__.is_set():
+            try:
+                self.__poll__()
+            except OSError as e:
+                # Replies in flight are lost with the link
+                for read in list(self.reads.values()):
+                    self.__finish__(read, exception=e)
+            self.__expire__()
+            entry = self.__take__(POLL_INTERVAL if self.reads else None)
+            if entry is None:
+                continue
+            now = time.monotonic()
+            self.__record__(entry, now)
+            if entry.future is None:
+                self.__write__(entry, now)
+            else:
+                self.__read__(entry)
+        # Fail whatever was left behind
+        for read in list(self.reads.values()):
+            self.__finish__(read, exception=CancelledError())
+        with self.cond:
+            for _, _, entry in self.queue:
+                if entry.future is not None:
+                    entry.future.cancel()
+            self.queue.clear()
+            self.pending.clear()
@@ -0,0 +1,85 @@
+# ===================================================================
+# Preallocated frame sender for high-rate write commands
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   rc = fc.sender(MSP.SET_RAW_RC, ROLL=1500, PITCH=1500, YAW=1500)
+#   while flying:
+#       rc["THROTTLE"] = throttle   # patches 2 bytes and the checksum
+#       rc.send()                   # one zero-copy write of the frame
+# The whole frame lives in one bytearray. Changing a field packs the new
+# value in place and, for MSP v1, updates the XOR checksum with the
+# difference of the old and new bytes. MSP v2 frames recompute their
+# CRC8 once before the next send.
+# ===================================================================
+from struct import Struct
+from .ByteCode import STRUCT_ENDIAN
+from .Command import WriteCMD
+from .Stream import DIRECTION, V2_HEADER, crc8, frame, pickVersion, xor8
+
+
+class FrameSender:
+    CMD: type[WriteCMD]
+    frame: bytearray
+    # key -> (absolute offset in frame, codec of the field, range check)
+    fields: dict
+
+    def __init__(self, fc, CMD: type[WriteCMD], *args, **kwargs):
+        assert CMD.simple, f"{CMD.__name__} has compound fields"
+        self.fc = fc
+        self.CMD = CMD
+        payload = CMD(*args, **kwargs).toBytes()
+        self.version = pickVersion(
+            fc.protocol, CMD.code, len(payload), fc.parser.version
+        )
+        self.frame = bytearray(frame(CMD.code, payload, self.version))
+        self.view = memoryview(self.frame)
+        # Frame layout: preamble | header | payload | checksum
+        self.start = 5 if self.version == 1 else 3 + V2_HEADER.size
+        self.end = self.start + len(payload)
+        self.payload = self.view[self.start : self.end]
+        self.fields = {}
+        offset = self.start
+        for key, dtype in CMD.struct.items():
+            codec = Struct(STRUCT_ENDIAN + dtype.fmt())
+            self.fields[key] = (offset, codec, dtype.check)
+            offset += dtype.byte_size
+        self.dirty = False
+
+    def __getitem__(self, key):
+        offset, codec, _ = self.fields[key]
+        return codec.unpack_from(self.frame, offset)[0]
+
+    def __setitem__(self, key, value: int):
+        offset, codec, check = self.fields[key]
+        stop = offset + codec.size
+        before = xor8(self.view[offset:stop])
+        codec.pack_into(self.frame, offset, check(value))
+        if self.version == 1:
+            self.frame[self.end] ^= before ^ xor8(self.view[offset:stop])
+        else:
+            self.dirty = True
+
+    def update(self, *args, **kwargs):
+        # Same argument convention as WriteCMD, unspecified fields untouched
+        for key, value in zip(self.fields, args):
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def values(self) -> dict:
+        return self.CMD.decode(self.payload)
+
+    def send(self):
+        if self.dirty:
+            self.frame[self.end] = crc8(self.view[3 : self.end])
+            self.dirty = False
+        for hook in self.fc.hooks:
+            hook(DIRECTION.SEND, self.CMD.code, self.payload)
+        self.fc.serial.write(self.view)
+        if self.fc.metrics is not None:
+            self.fc.metrics.sent(len(self.frame))
+        if self.fc.cache is not None:
+            self.fc.cache.written(self.CMD)
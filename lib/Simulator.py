@@ -0,0 +1,157 @@
+# ===================================================================
+# Simulated flight controller, usable as a MultiWii transport
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Usage:
+#   sim = SimulatedFC(latency=0.002, baudrate=115200, error_rate=1e-4)
+#   fc = MultiWii(transport=sim)
+#   sim.set(MSP.ATTITUDE, angx=10, angy=-5, heading=90)
+# Every ReadCMD in lib/MSP.py is answered, with synthetic payloads unless
+# a value was set or recorded. Every WriteCMD is acknowledged with an
+# empty frame (like MultiWii firmware does), and SET_X commands update
+# the state read back by the matching X command. Requests are answered
+# in the MSP version (v1 or v2) they were sent with, or v2 if the reply
+# does not fit in a v1 frame.
+# ===================================================================
+import random, threading, time
+from collections import deque
+from . import MSP  # defining the commands fills the registry
+from .Command import COMMANDS, MSP_Command, mirror
+from .Stream import PREAMBLE, DIRECTION, FrameParser, frame, pickVersion
+from .Timeout import wire_time
+
+
+class SimulatedFC:
+    # Transport interface (see lib/Transport.py)
+    timeout: float | None
+    baudrate: int | None
+    # Simulated link properties
+    latency: float
+    error_rate: float
+    # Payload answered for every read code
+    state: dict[int, bytes]
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        baudrate: int = None,
+        error_rate: float = 0.0,
+        timeout: float = 0.1,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.baudrate = baudrate
+        self.error_rate = error_rate
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.read_commands = {CMD.code: CMD for CMD in COMMANDS.reads()}
+        self.write_commands = {CMD.code: CMD for CMD in COMMANDS.writes()}
+        self.mirror = mirror(self.write_commands, self.read_commands)
+        self.state = {
+            code: self.random.randbytes(CMD.size)
+            for code, CMD in self.read_commands.items()
+        }
+        self.parser = FrameParser(PREAMBLE.SEND)
+        # Outgoing bytes: (time they become readable, chunk)
+        self.queue = deque()
+        self.buffer = bytearray()
+        self.busy_until = 0.0
+        self.cond = threading.Condition()
+        # Statistics
+        self.requests = 0
+        self.corrupted_bytes = 0
+
+    # -- State ----------------------------------------------------------
+
+    def set(self, CMD: type[MSP_Command], *args, **kwargs):
+        # Replace the payload answered for CMD, fields as in WriteCMD
+        values = dict(zip(CMD.struct.keys(), args), **kwargs)
+        self.state[CMD.code] = CMD.encode(values)
+
+    def replay(self, frames):
+        # Load recorded (code, payload) pairs, the latest one of a code wins
+        for code, payload in frames:
+            if code in self.read_commands:
+                self.state[code] = bytes(payload)
+
+    # -- Link model -----------------------------------------------------
+
+    def __corrupt__(self, data: bytes) -> bytes:
+        if not self.error_rate:
+            return data
+        data = bytearray(data)
+        for i in range(len(data)):
+            if self.random.random() < self.error_rate:
+                data[i] ^= 1 << self.random.randrange(8)
+                self.corrupted_bytes += 1
+        return bytes(data)
+
+    def __reply__(self, code: int, payload: bytes) -> bytes:
+        # Answer in the protocol version of the request, unless too large
+        version = pickVersion(None, code, len(payload), self.parser.version)
+        return frame(code, payload, version, DIRECTION.RECV)
+
+    def __handle__(self, code: int, payload: bytes) -> bytes | None:
+        if code in self.read_commands:
+            return self.__reply__(code, self.state[code])
+        if code in self.write_commands:
+            if code in self.mirror:
+                self.state[self.mirror[code]] = payload
+            return self.__reply__(code, b"")
+        return None
+
+    def __release__(self):
+        # Move every chunk whose arrival time has passed to the read buffer
+        now = time.monotonic()
+        while self.queue and self.queue[0][0] <= now:
+            self.buffer += self.queue.popleft()[1]
+
+    # -- Transport interface --------------------------------------------
+
+    def write(self, data: bytes) -> int:
+        now = time.monotonic()
+        arrival = now + wire_time(len(data), self.baudrate)
+        self.parser.feed(self.__corrupt__(data))
+        with self.cond:
+            for code, payload in self.parser:
+                self.requests += 1
+                reply = self.__handle__(code, payload)
+                if reply is None:
+                    continue
+                start = max(arrival + self.latency, self.busy_until)
+                self.busy_until = start + wire_time(len(reply), self.baudrate)
+                self.queue.append((self.busy_until, self.__corrupt__(reply)))
+            self.cond.notify_all()
+        return len(data)
+
+    @property
+    def in_waiting(self) -> int:
+        with self.cond:
+            self.__release__()
+            return len(self.buffer)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self.cond:
+            while True:
+                self.__release__()
+                if len(self.buffer) >= size:
+                    break
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                wake = deadline
+                if self.queue and (wake is None or self.queue[0][0] < wake):
+                    wake = self.queue[0][0]
+                self.cond.wait(None if wake is None else max(0.0, wake - now))
+            result = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return result
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,258 @@
+# ===================================================================
+# Incremental MSP frame parser
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Bytes are accumulated in a bytearray and scanned with bytearray.find,
+# so finding a preamble or a complete frame never touches the payload
+# byte by byte in Python.
+# Any object exposing `in_waiting` and `read(n)` (like serial.Serial)
+# can be drained by FrameParser.read(), which makes it straightforward
+# to drive the parser with fake serial objects delivering arbitrary
+# chunk splits.
+# Every chunk is stamped with time.monotonic() when it is fed, so the
+# arrival time of the first byte of a frame (`stamp`) is known without
+# timing the decode.
+# ===================================================================
+
+
+import time
+from collections import deque
+from struct import Struct
+
+# MSP v2 header following the preamble: flag, command, payload size
+V2_HEADER = Struct("<BHH")
+
+
+class PREAMBLE:
+    SEND = b"$M<"
+    RECV = b"$M>"
+    # MSP v2
+    SEND_V2 = b"$X<"
+    RECV_V2 = b"$X>"
+
+
+class DIRECTION:
+    # Direction byte of the preamble, also used to tag logged frames
+    SEND = PREAMBLE.SEND[-1]
+    RECV = PREAMBLE.RECV[-1]
+
+
+# Protocol version selected by the second preamble byte
+VERSIONS = {ord("M"): 1, ord("X"): 2}
+START = ord("$")
+# Largest MSP v2 payload accepted by default: the whole 16-bit range.
+# Links that never carry large frames can pass a lower limit to the
+# parser, so that a header found in line noise does not hold back every
+# valid frame behind it while its announced payload is awaited.
+MAX_V2_PAYLOAD = 0xFFFF
+
+
+def xor8(data: bytes) -> int:
+    # XOR of all bytes, folded on a single big integer instead of a
+    # per-byte Python loop
+    value = int.from_bytes(data, "little")
+    width = len(data) * 8
+    while width > 8:
+        width = (width // 8 + 1) // 2 * 8
+        value = (value >> width) ^ (value & ((1 << width) - 1))
+    return value
+
+
+def __crc_table__(poly: int) -> bytes:
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly if crc & 0x80 else crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+CRC8_DVB_S2 = __crc_table__(0xD5)
+
+
+def crc8(data: bytes, crc: int = 0) -> int:
+    # CRC8/DVB-S2 used by MSP v2, one table lookup per byte
+    table = CRC8_DVB_S2
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def frame(
+    code: int, payload: bytes = b"", version: int = 1, direction: int = DIRECTION.SEND
+) -> bytes:
+    size = len(payload)
+    if version == 1:
+        checksum = size ^ code ^ xor8(payload)
+        return b"$M" + bytes((direction, size, code)) + payload + bytes((checksum,))
+    header = V2_HEADER.pack(0, code, size)
+    checksum = crc8(payload, crc8(header))
+    return b"$X" + bytes((direction,)) + header + payload + bytes((checksum,))
+
+
+def pickVersion(protocol: int | None, code: int, size: int, peer: int | None) -> int:
+    # Fixed protocol if configured, otherwise v1 unless the frame does not
+    # fit in v1 or the peer was heard speaking v2
+    if protocol:
+        return protocol
+    if code > 0xFF or size > 0xFF or peer == 2:
+        return 2
+    return 1
+
+
+class FrameParser:
+    buffer: bytearray
+    direction: int
+    # Second preamble bytes accepted (e.g. only b"M" when pinned to MSP v1)
+    accepts: set[int]
+    # Protocol version of the last emitted frame
+    version: int | None
+    # Host time (time.monotonic) the first byte of the last emitted frame
+    # arrived, and the wire time of one byte used to refine it (0: unknown)
+    stamp: float | None
+    byte_time: float
+    # Statistics
+    frames: int
+    checksum_errors: int
+    garbage_bytes: int
+    # v2 headers dropped for announcing more than max_payload bytes
+    oversized: int
+    total_bytes: int
+
+    def __init__(
+        self,
+        preamble: bytes = PREAMBLE.RECV,
+        protocol: int = None,
+        max_payload: int = MAX_V2_PAYLOAD,
+    ):
+        # Frames in the direction of the preamble, of the given protocol
+        # version or of both MSP v1 and v2 if None
+        self.buffer = bytearray()
+        self.max_payload = max_payload
+        self.direction = preamble[-1]
+        self.accepts = {b for b, v in VERSIONS.items() if protocol in (None, v)}
+        self.version = None
+        self.stamp = None
+        self.byte_time = 0.0
+        # (total_bytes after a chunk, time the chunk was fed)
+        self.marks = deque()
+        self.frames = 0
+        self.checksum_errors = 0
+        self.garbage_bytes = 0
+        self.oversized = 0
+        self.total_bytes = 0
+
+    @property
+    def needed(self) -> int:
+        # Minimum number of bytes required before another frame can be
+        # emitted, useful for sizing the next blocking read
+        buffer = self.buffer
+        if len(buffer) < 3:
+            return 3 - len(buffer)
+        if VERSIONS.get(buffer[1]) == 2:
+            header = 3 + V2_HEADER.size
+            size = buffer[6] | buffer[7] << 8 if len(buffer) >= header else 0
+            if size > self.max_payload:
+                # Oversized, dropped by the next call to next()
+                return 1
+        else:
+            header = 5
+            size = buffer[3] if len(buffer) >= header else 0
+        return max(1, header + size + 1 - len(buffer))
+
+    def feed(self, data: bytes, stamp: float = None):
+        # stamp: time the chunk was read, now by default
+        self.total_bytes += len(data)
+        self.buffer += data
+        self.marks.append(
+            (self.total_bytes, time.monotonic() if stamp is None else stamp)
+        )
+
+    def reset(self):
+        # Drop buffered bytes (e.g. after a reconnect), counters are kept
+        self.__discard__(len(self.buffer))
+        self.marks.clear()
+        self.version = None
+
+    def __stamp__(self, index: int) -> float:
+        # Arrival time of the byte at absolute position index, assuming the
+        # bytes of its chunk arrived back to back until the chunk was read
+        marks = self.marks
+        while marks[0][0] <= index:
+            marks.popleft()
+        end, stamp = marks[0]
+        return stamp - (end - 1 - index) * self.byte_time
+
+    def __discard__(self, count: int):
+        self.garbage_bytes += count
+        del self.buffer[:count]
+
+    def next(self) -> tuple[int, bytes] | None:
+        buffer = self.buffer
+        while True:
+            start = buffer.find(START)
+            if start < 0:
+                self.__discard__(len(buffer))
+                self.marks.clear()
+                return None
+            if start:
+                self.__discard__(start)
+            if (len(buffer) > 1 and buffer[1] not in self.accepts) or (
+                len(buffer) > 2 and buffer[2] != self.direction
+            ):
+                # Not a preamble, look for the next one
+                self.__discard__(1)
+                continue
+            if len(buffer) < 3:
+                return None
+            version = VERSIONS[buffer[1]]
+            if version == 1:
+                if len(buffer) < 5:
+                    return None
+                size, code = buffer[3], buffer[4]
+                end = 5 + size + 1
+                if len(buffer) < end:
+                    return None
+                valid = xor8(buffer[3:end]) == 0
+            else:
+                if len(buffer) < 3 + V2_HEADER.size:
+                    return None
+                _, code, size = V2_HEADER.unpack_from(buffer, 3)
+                if size > self.max_payload:
+                    # Not a plausible header, resync on the next preamble
+                    self.oversized += 1
+                    del buffer[:1]
+                    continue
+                end = 3 + V2_HEADER.size + size + 1
+                if len(buffer) < end:
+                    return None
+                valid = crc8(memoryview(buffer)[3 : end - 1]) == buffer[end - 1]
+            if not valid:
+                # Corrupted frame: skip its preamble and resync on the next
+                self.checksum_errors += 1
+                self.__discard__(1)
+                continue
+            data = bytes(buffer[end - 1 - size : end - 1])
+            self.stamp = self.__stamp__(self.total_bytes - len(buffer))
+            del buffer[:end]
+            self.frames += 1
+            self.version = version
+            return code, data
+
+    def __iter__(self):
+        while (frame := self.next()) is not None:
+            yield frame
+
+    def read(self, serial) -> tuple[int, bytes] | None:
+        # Returns the next complete frame, or None if the serial timed out
+        frame = self.next()
+        while frame is None:
+            chunk = serial.read(max(serial.in_waiting, self.needed))
+            if not chunk:
+                return None
+            self.feed(chunk)
+            frame = self.next()
+        return frame
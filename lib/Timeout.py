@@ -0,0 +1,81 @@
+# ===================================================================
+# Adaptive request timeouts from measured round-trip times
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# Round-trip samples, minus the time the bytes spend on the wire, feed a
+# TCP style estimator (RFC 6298): a smoothed RTT and its mean deviation.
+# A request then waits for
+#   wire time of request and reply at the baud rate + srtt + 4 * rttvar
+# which stays tight on a healthy link. Every timeout doubles the margin
+# (up to MAX_RTO) until a reply arrives again. Samples of retried
+# requests are ambiguous and never used (Karn's algorithm), but their
+# reply still ends the backoff.
+# ===================================================================
+
+# Serial line cost of one byte: start bit + 8 data bits + stop bit
+BITS_PER_BYTE = 10
+# Bytes of MSP v1 framing around every payload: preamble, size, code, crc
+FRAME_OVERHEAD = 6
+# Gains of the smoothed RTT and of its deviation
+ALPHA = 1 / 8
+BETA = 1 / 4
+# Bounds of the latency margin, in seconds
+MIN_RTO = 0.005
+MAX_RTO = 2.0
+
+
+def wire_time(size: int, baudrate: int | None) -> float:
+    # Seconds size bytes occupy the serial line, 0 if the rate is unknown
+    if not baudrate:
+        return 0.0
+    return size * BITS_PER_BYTE / baudrate
+
+
+class RTTEstimator:
+    # Smoothed latency and its mean deviation, None before the first sample
+    srtt: float | None
+    rttvar: float | None
+    # Current latency margin of a request
+    rto: float
+
+    def __init__(self, initial: float = 0.1, baudrate: int = None):
+        self.baudrate = baudrate
+        self.srtt = None
+        self.rttvar = None
+        self.initial = initial
+        self.rto = initial
+
+    def wire_time(self, size: int) -> float:
+        return wire_time(size, self.baudrate)
+
+    def timeout(self, size: int) -> float:
+        # Time to wait for a round-trip moving `size` bytes in total
+        return self.wire_time(size) + self.rto
+
+    def sample(self, seconds: float, size: int):
+        rtt = max(0.0, seconds - self.wire_time(size))
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar += BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += ALPHA * (rtt - self.srtt)
+        self.settle()
+
+    def settle(self):
+        # Margin derived from the estimate, dropping any backoff
+        if self.srtt is not None:
+            self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def backoff(self):
+        self.rto = min(MAX_RTO, self.rto * 2)
+
+    def reset(self):
+        # Forget the link history (e.g. after a reconnect)
+        self.srtt = self.rttvar = None
+        self.rto = self.initial
+
+    def __repr__(self):
+        srtt = "-" if self.srtt is None else f"{self.srtt * 1e3:.2f}ms"
+        return f"RTTEstimator(srtt={srtt}, rto={self.rto * 1e3:.2f}ms)"
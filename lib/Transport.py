@@ -0,0 +1,210 @@
+# ===================================================================
+# Byte transport interface used by MultiWii
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+# MultiWii only relies on the subset of serial.Serial listed below, so
+# anything implementing it (simulators, sockets, loopbacks) can stand in
+# for a real serial port:
+#   fc = MultiWii(transport=SimulatedFC())
+#   fc = MultiWii("tcp://127.0.0.1:5760")   # e.g. through lib/Bridge.py
+# ===================================================================
+import glob, socket, time
+from typing import Protocol
+import serial
+
+# Delays between reconnection attempts, doubled up to the maximum
+RECONNECT_DELAY = 0.05
+RECONNECT_MAX_DELAY = 1.0
+
+
+class Transport(Protocol):
+    # Seconds a read may block, None blocks forever
+    timeout: float | None
+    # Line rate in bits per second
+    baudrate: int
+
+    @property
+    def in_waiting(self) -> int:
+        # Number of bytes that can be read without blocking
+        ...
+
+    def read(self, size: int = 1) -> bytes:
+        # Block until size bytes arrived or timeout expired
+        ...
+
+    def write(self, data: bytes) -> int | None: ...
+
+    def close(self): ...
+
+
+def discover_all() -> list[str]:
+    return sorted(glob.glob("/dev/ttyACM*"))
+
+
+def discover() -> str:
+    path = discover_all()[0]
+    print(f"Using serial device {path}")
+    return path
+
+
+def open_serial(path: str = None, baud: int = 115200, timeout: float = 0.1):
+    if path is None:
+        path = discover()
+    return serial.Serial(path, baud, timeout=timeout)
+
+
+class ReconnectingSerial:
+    """
+    Serial port that reopens itself when the device disappears (USB
+    dropout, controller reboot). A failed read reconnects and returns no
+    data, like a timeout would, so the caller simply retries. A failed
+    write is repeated once after reconnecting. Gives up (re-raising the
+    error) when the device is not back within `patience` seconds.
+    Without a fixed path, the first discovered device is used on every
+    attempt, in case it came back under another name.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        baud: int = 115200,
+        timeout: float = 0.1,
+        patience: float = 5.0,
+    ):
+        self.path = path
+        self.baudrate = baud
+        self.patience = patience
+        self.reconnects = 0
+        # Called without arguments after every successful reconnect
+        self.callbacks = []
+        self.port = open_serial(path, baud, timeout)
+
+    @property
+    def timeout(self) -> float | None:
+        return self.port.timeout
+
+    @timeout.setter
+    def timeout(self, value: float | None):
+        self.port.timeout = value
+
+    def reconnect(self):
+        timeout = self.port.timeout
+        try:
+            self.port.close()
+        except OSError:
+            pass
+        deadline = time.monotonic() + self.patience
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                path = self.path or discover_all()[0]
+                self.port = serial.Serial(path, self.baudrate, timeout=timeout)
+                self.reconnects += 1
+                break
+            except (IndexError, OSError):
+                if time.monotonic() + delay > deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        for callback in self.callbacks:
+            callback()
+
+    @property
+    def in_waiting(self) -> int:
+        try:
+            return self.port.in_waiting
+        except OSError:
+            # Also serial.SerialException (a subclass): the port is gone
+            self.reconnect()
+            return 0
+
+    def read(self, size: int = 1) -> bytes:
+        try:
+            return self.port.read(size)
+        except OSError:
+            self.reconnect()
+            return b""
+
+    def write(self, data: bytes) -> int | None:
+        try:
+            return self.port.write(data)
+        except OSError:
+            self.reconnect()
+            return self.port.write(data)
+
+    def flush(self):
+        self.port.flush()
+
+    def close(self):
+        self.port.close()
+
+
+class SocketTransport:
+    """
+    Stream socket speaking raw MSP, e.g. a connection to lib/Bridge.py.
+    Addresses are "tcp://host:port" or "unix:///path/to/socket".
+    """
+
+    # Unknown line rate, wire time is not accounted for
+    baudrate = None
+
+    def __init__(self, sock: socket.socket, timeout: float = 0.1):
+        self.sock = sock
+        self.timeout = timeout
+        self.buffer = bytearray()
+
+    @classmethod
+    def connect(cls, address: str, timeout: float = 0.1) -> "SocketTransport":
+        scheme, _, location = address.partition("://")
+        if scheme == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(location)
+        elif scheme == "tcp":
+            host, _, port = location.rpartition(":")
+            sock = socket.create_connection((host, int(port)))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            raise ValueError(f"unsupported address {address}")
+        return cls(sock, timeout)
+
+    def __fill__(self, timeout: float | None) -> bool:
+        # Receive whatever arrives within timeout, False on timeout
+        self.sock.settimeout(timeout)
+        try:
+            chunk = self.sock.recv(65536)
+        except (BlockingIOError, socket.timeout):
+            return False
+        if not chunk:
+            raise ConnectionError("MSP socket closed by peer")
+        self.buffer += chunk
+        return True
+
+    @property
+    def in_waiting(self) -> int:
+        while self.__fill__(0):
+            pass
+        return len(self.buffer)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(self.buffer) < size:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            if not self.__fill__(remaining):
+                break
+        result = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return result
+
+    def write(self, data: bytes) -> int:
+        self.sock.sendall(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.sock.close()
@@ -4,5 +4,7 @@
 # Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
 # Published under MIT License
 # ===================================================================
-from .MultiWii import MultiWii
+from .MultiWii import MultiWii, BatchTimeout, RequestTimeout
+from .AsyncMultiWii import AsyncMultiWii
 from . import MSP, ByteCode as BC
+from .Command import COMMANDS
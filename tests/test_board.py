@@ -0,0 +1,77 @@
+# ===================================================================
+# Shared memory telemetry board
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import multiprocessing, os, uuid
+import pytest
+from lib import MultiWii, MSP
+from lib import Board
+from lib.Board import Publisher, Reader, Segment
+from lib.Simulator import SimulatedFC
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="POSIX shared memory")
+
+
+@pytest.fixture
+def board():
+    fc = MultiWii(transport=SimulatedFC())
+    with Publisher(fc, name=f"msp-test-{uuid.uuid4().hex[:8]}") as board:
+        yield fc, board
+
+
+def test_round_trip(board):
+    fc, board = board
+    with Reader(board.name) as reader:
+        assert reader.read(MSP.ATTITUDE) is None
+        attitude = fc.invoke(MSP.ATTITUDE())
+        snapshot = reader.read(MSP.ATTITUDE)
+        assert snapshot.value == attitude
+        assert snapshot.time == attitude.timing.received
+        assert snapshot.seq == 1
+        assert set(reader.snapshot()) == {MSP.ATTITUDE}
+
+
+def test_segment(board, monkeypatch):
+    # Mapping used to attach before Python 3.13, exercised on any version
+    fc, board = board
+    monkeypatch.setattr(Board, "attach", Segment)
+    fc.invoke(MSP.RC())
+    with Reader(board.name) as reader:
+        assert isinstance(reader.shm, Segment)
+        assert reader.read(MSP.RC).value == fc.invoke(MSP.RC())
+        with pytest.raises(TypeError):
+            reader.shm.buf[0] = 0
+
+
+def read_in_child(name: str, queue):
+    with Reader(name) as reader:
+        queue.put(reader.read(MSP.ATTITUDE).value.payload)
+
+
+def test_reader_exit_keeps_segment(board):
+    # A reader process exiting must not unlink the publisher's segment
+    fc, board = board
+    fc.invoke(MSP.ATTITUDE())
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=read_in_child, args=(board.name, queue))
+    process.start()
+    payload = queue.get(timeout=10)
+    process.join(10)
+    assert payload == fc.invoke(MSP.ATTITUDE()).payload
+    with Reader(board.name) as reader:
+        assert reader.read(MSP.ATTITUDE) is not None
+
+
+def test_checksum_mismatch_is_retried(board, monkeypatch):
+    # A slot whose data does not match its checksum is never returned
+    fc, board = board
+    monkeypatch.setattr(Board, "STALL_TIMEOUT", 0.05)
+    fc.invoke(MSP.ATTITUDE())
+    offset, _ = board.slots[MSP.ATTITUDE.code]
+    board.shm.buf[offset + Board.SLOT_HEADER] ^= 0xFF
+    with Reader(board.name) as reader:
+        with pytest.raises(TimeoutError):
+            reader.read(MSP.ATTITUDE)
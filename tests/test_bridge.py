@@ -0,0 +1,91 @@
+# ===================================================================
+# Bridge served on local sockets, with a simulated flight controller
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import asyncio, socket, threading
+import pytest
+from lib import MultiWii, MSP
+from lib.Bridge import Bridge
+from lib.Simulator import SimulatedFC
+from lib.Stream import PREAMBLE, FrameParser, frame
+
+
+async def shutdown(servers: list):
+    # Stop listening and let the client tasks finish their cancellation
+    for server in servers:
+        server.close()
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture
+def bridge(tmp_path):
+    # Bridge running on its own event loop thread: (bridge, tcp address,
+    # unix socket path, simulator)
+    sim = SimulatedFC(timeout=0.5)
+    bridge = Bridge(MultiWii(transport=sim))
+    loop = asyncio.new_event_loop()
+    path = str(tmp_path / "msp.sock")
+    servers = loop.run_until_complete(bridge.serve(("127.0.0.1", 0), path))
+    host, port = servers[0].sockets[0].getsockname()[:2]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield bridge, f"tcp://{host}:{port}", path, sim
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(1)
+    loop.run_until_complete(shutdown(servers))
+    loop.close()
+    bridge.close()
+
+
+def test_invoke(bridge):
+    bridge, address, _, sim = bridge
+    fc = MultiWii(address, timeout=0.5)
+    assert fc.invoke(MSP.ATTITUDE()).payload == sim.state[MSP.ATTITUDE.code]
+    fc.invoke(MSP.SET_RAW_RC(1500, 1500, 1500, 1200))
+    assert fc.invoke(MSP.RC())["THROTTLE"] == 1200
+
+
+def test_unix_socket(bridge):
+    _, _, path, sim = bridge
+    fc = MultiWii(f"unix://{path}", timeout=0.5)
+    assert fc.invoke(MSP.RC()).payload == sim.state[MSP.RC.code]
+
+
+def test_duplicate_reads_are_all_answered(bridge):
+    # Identical requests pipelined in one write share a single request to
+    # the controller, but each of them gets its reply
+    bridge, address, _, _ = bridge
+    fc = MultiWii(address, timeout=0.5)
+    results = fc.invoke_many([MSP.RC(), MSP.RC(), MSP.RC()], timeout=1.0)
+    assert len(results) == 3 and all(r is not None for r in results)
+
+
+def test_duplicate_reads_raw(bridge):
+    _, address, _, sim = bridge
+    host, port = address[len("tcp://") :].rsplit(":", 1)
+    with socket.create_connection((host, int(port)), timeout=1.0) as client:
+        client.sendall(frame(MSP.RC.code) * 2)
+        parser = FrameParser(PREAMBLE.RECV)
+        replies = []
+        while len(replies) < 2:
+            parser.feed(client.recv(4096))
+            replies.extend(parser)
+    assert replies == [(MSP.RC.code, sim.state[MSP.RC.code])] * 2
+
+
+def test_link_error_closes_client(bridge):
+    bridge, address, _, _ = bridge
+
+    def broken(*_):
+        raise ConnectionResetError("link lost")
+
+    bridge.fc.request = broken
+    host, port = address[len("tcp://") :].rsplit(":", 1)
+    with socket.create_connection((host, int(port)), timeout=1.0) as client:
+        client.sendall(frame(MSP.RC.code))
+        assert client.recv(4096) == b""
@@ -0,0 +1,93 @@
+# ===================================================================
+# Offline capture decoder, independent of the chunk split
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import random
+import pytest
+
+np = pytest.importorskip("numpy")
+from lib import MSP
+from lib.Capture import OFFSET_FIELD, decode
+from lib.Stream import DIRECTION, frame
+
+
+def capture(seed: int) -> tuple[bytes, dict[str, int], int]:
+    # Traffic of both directions and versions, with frames hidden inside
+    # payloads (a chunk may start on them) and corrupted frames. Returns
+    # the bytes, the expected number of frames per table and of errors.
+    rng = random.Random(seed)
+    data, expected, errors = bytearray(), {}, 0
+    for _ in range(400):
+        kind = rng.randrange(5)
+        if kind == 0:
+            # Request
+            data += frame(MSP.RC.code, b"", rng.choice((1, 2)), DIRECTION.SEND)
+            key = "send/RC"
+        elif kind == 1:
+            payload = rng.randbytes(MSP.ATTITUDE.size)
+            data += frame(MSP.ATTITUDE.code, payload, 1, DIRECTION.RECV)
+            key = "recv/ATTITUDE"
+        elif kind == 2:
+            # Raw payload whose bytes contain complete frames
+            inner = frame(MSP.ATTITUDE.code, bytes(6), 1, DIRECTION.RECV)
+            payload = rng.randbytes(rng.randrange(8)) + inner * 3
+            data += frame(MSP.BOXNAMES.code, payload, 2, DIRECTION.RECV)
+            key = "recv/BOXNAMES"
+        elif kind == 3:
+            data += frame(0x3001, rng.randbytes(rng.randrange(300)), 2, DIRECTION.RECV)
+            key = f"recv/{0x3001}"
+        else:
+            bad = bytearray(frame(MSP.RC.code, bytes(32), 1, DIRECTION.RECV))
+            bad[-1] ^= 0x55
+            data += bad
+            errors += 1
+            key = None
+        if key is not None:
+            expected[key] = expected.get(key, 0) + 1
+        data += rng.randbytes(rng.randrange(4)).replace(b"$", b"#")
+    return bytes(data), expected, errors
+
+
+@pytest.fixture(scope="module")
+def path(tmp_path_factory):
+    data, expected, errors = capture(0)
+    path = tmp_path_factory.mktemp("capture") / "capture.bin"
+    path.write_bytes(data)
+    return str(path), expected, errors
+
+
+def same(a: dict, b: dict) -> bool:
+    if a.keys() != b.keys():
+        return False
+    for key in a:
+        if a[key].keys() != b[key].keys():
+            return False
+        if not all(np.array_equal(a[key][c], b[key][c]) for c in a[key]):
+            return False
+    return True
+
+
+def test_single_chunk(path):
+    path, expected, errors = path
+    tables, found = decode(path, jobs=1)
+    assert {k: len(t[OFFSET_FIELD]) for k, t in tables.items()} == expected
+    assert found == errors
+
+
+@pytest.mark.parametrize("chunk_size", (16, 61, 100, 257, 1000, 4099))
+def test_chunk_size_does_not_matter(path, chunk_size):
+    path, _, _ = path
+    reference = decode(path, jobs=1)
+    tables, errors = decode(path, jobs=1, chunk_size=chunk_size)
+    assert errors == reference[1]
+    assert same(tables, reference[0])
+
+
+def test_parallel(path):
+    path, _, _ = path
+    reference = decode(path, jobs=1)
+    tables, errors = decode(path, jobs=2, chunk_size=500)
+    assert errors == reference[1]
+    assert same(tables, reference[0])
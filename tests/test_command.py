@@ -0,0 +1,59 @@
+# ===================================================================
+# Field defaults and range checks of write commands
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import pytest
+from lib import MultiWii, MSP
+from lib.ByteCode import I16, U8, U16
+from lib.Command import COMMANDS
+from lib.Simulator import SimulatedFC
+
+
+def test_default_is_in_range():
+    assert U16.default == 0
+    assert U16.within(1000, 2000).default == 1000
+    assert I16.within(-180, 180).default == 0
+    assert I16.within(-200, -100).default == -100
+    assert U8.within(0, 100).default == 0
+
+
+def test_unset_fields_are_in_range():
+    rc = MSP.SET_RAW_RC(1500, 1500, 1500, 1000)
+    assert rc["AUX1"] == 1000
+    assert MSP.SET_HEAD().magHold == 0
+    assert MSP.SET_RAW_RC.decode(MSP.SET_RAW_RC.encode({}))["ROLL"] == 1000
+
+
+@pytest.mark.parametrize("CMD", COMMANDS.writes(), ids=lambda CMD: CMD.__name__)
+def test_values_can_be_given_back(CMD):
+    # Whatever an instance holds, it can be assigned again
+    command = CMD()
+    command.update(*command.values)
+    for key in CMD.struct:
+        command[key] = command[key]
+    assert CMD(*command.values).toBytes() == command.toBytes()
+
+
+def test_out_of_range():
+    rc = MSP.SET_RAW_RC(1500, 1500, 1500, 1000)
+    with pytest.raises(ValueError):
+        MSP.SET_RAW_RC(999)
+    with pytest.raises(ValueError):
+        rc.update(THROTTLE=2001)
+    with pytest.raises(ValueError):
+        rc["AUX1"] = 0
+    with pytest.raises(ValueError):
+        MSP.SET_HEAD(181)
+
+
+def test_sender_fields_can_be_given_back():
+    fc = MultiWii(transport=SimulatedFC())
+    sender = fc.sender(MSP.SET_RAW_RC, ROLL=1500, PITCH=1500, YAW=1500)
+    sender["AUX1"] = sender["AUX1"]
+    sender["THROTTLE"] = 1200
+    sender.send()
+    assert fc.invoke(MSP.RC())["THROTTLE"] == 1200
+    with pytest.raises(ValueError):
+        sender["THROTTLE"] = 0
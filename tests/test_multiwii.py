@@ -0,0 +1,40 @@
+# ===================================================================
+# MultiWii against a simulated flight controller
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+from lib import MultiWii, MSP
+from lib.Simulator import SimulatedFC
+
+
+def test_unsolicited_frames_keep_arrival_order():
+    # Frames of the same code nobody waited for are all kept, in order
+    sim = SimulatedFC(timeout=0.5)
+    fc = MultiWii(transport=sim)
+    for throttle in (1100, 1200, 1300):
+        sim.set(MSP.RC, THROTTLE=throttle)
+        fc.__send__(MSP.RC.code)
+    sim.set(MSP.ATTITUDE, angx=10)
+    assert fc.invoke(MSP.ATTITUDE())["angx"] == 10
+    received = [value["THROTTLE"] for _, _, value in fc.frames(timeout=0.05)]
+    assert received == [1100, 1200, 1300]
+
+
+def test_frames_yield_responses():
+    sim = SimulatedFC(timeout=0.5)
+    fc = MultiWii(transport=sim)
+    fc.__send__(MSP.ATTITUDE.code)
+    fc.__send__(MSP.SET_RAW_RC.code, MSP.SET_RAW_RC(1500).toBytes())
+    fc.__send__(MSP.RC.code)
+    frames = list(fc.frames(timeout=0.05))
+    assert [(code, CMD) for code, CMD, _ in frames] == [
+        (MSP.ATTITUDE.code, MSP.ATTITUDE),
+        (MSP.SET_RAW_RC.code, MSP.SET_RAW_RC),
+        (MSP.RC.code, MSP.RC),
+    ]
+    attitude, ack, rc = (value for _, _, value in frames)
+    assert isinstance(attitude, MSP.ATTITUDE.Response)
+    assert attitude == fc.invoke(MSP.ATTITUDE())
+    assert ack is None
+    assert rc.to_dict() == fc.invoke(MSP.RC()).to_dict()
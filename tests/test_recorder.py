@@ -0,0 +1,27 @@
+# ===================================================================
+# Ring buffers of recorded telemetry
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import pytest
+
+np = pytest.importorskip("numpy")
+from lib import MSP
+from lib.Recorder import Ring
+
+
+def attitude(angx: int) -> bytes:
+    return MSP.ATTITUDE.encode({"angx": angx})
+
+
+@pytest.mark.parametrize("count", (3, 6))
+def test_ordered_is_a_chronological_copy(count):
+    # Before and after the ring wraps
+    ring = Ring(MSP.ATTITUDE, 4)
+    for i in range(count):
+        ring.append(attitude(i), float(i))
+    ordered = ring.ordered()
+    assert ordered["angx"].tolist() == list(range(count))[-4:]
+    ordered["angx"] = -1
+    assert ring.ordered()["angx"].tolist() == list(range(count))[-4:]
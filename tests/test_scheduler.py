@@ -0,0 +1,103 @@
+# ===================================================================
+# Scheduler against a simulated flight controller
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import threading
+import pytest
+from lib import MultiWii, MSP, RequestTimeout
+from lib.Scheduler import Scheduler
+from lib.Simulator import SimulatedFC
+from lib.Stream import DIRECTION
+
+
+@pytest.fixture
+def link():
+    # (scheduler, simulator, [(direction, code)] of every frame on the link)
+    sim = SimulatedFC(latency=0.002, baudrate=115200, timeout=0.1)
+    fc = MultiWii(transport=sim, timeout=0.05)
+    events = []
+    fc.hooks.append(lambda direction, code, payload: events.append((direction, code)))
+    scheduler = Scheduler(fc)
+    yield scheduler, sim, events
+    scheduler.stop()
+    scheduler.join(1)
+
+
+def sent(events: list) -> list[int]:
+    return [code for direction, code in events if direction == DIRECTION.SEND]
+
+
+def test_setpoints_coalesce(link):
+    scheduler, sim, events = link
+    for throttle in (1100, 1200, 1300):
+        scheduler.submit(MSP.SET_RAW_RC(1500, 1500, 1500, throttle))
+    scheduler.start()
+    attitude = scheduler.submit(MSP.ATTITUDE()).result(1)
+    assert attitude.payload == sim.state[MSP.ATTITUDE.code]
+    assert scheduler.coalesced == 2
+    assert sent(events).count(MSP.SET_RAW_RC.code) == 1
+    assert MSP.RC.decode(sim.state[MSP.RC.code])["THROTTLE"] == 1300
+
+
+def test_control_before_queued_reads(link):
+    scheduler, _, events = link
+    reads = [scheduler.submit(CMD()) for CMD in (MSP.RAW_IMU, MSP.ATTITUDE)]
+    scheduler.submit(MSP.SET_RAW_RC(1500, 1500, 1500, 1200))
+    scheduler.start()
+    for future in reads:
+        future.result(1)
+    assert sent(events)[0] == MSP.SET_RAW_RC.code
+
+
+def test_control_while_read_in_flight(link):
+    # A setpoint does not wait for the reply of the read sent before it
+    scheduler, sim, events = link
+    sim.latency = 0.1
+    requested = threading.Event()
+    scheduler.fc.hooks.append(
+        lambda direction, code, _: code == MSP.ATTITUDE.code and requested.set()
+    )
+    scheduler.fc.retries = 0
+    scheduler.fc.rtt.rto = 1.0
+    scheduler.start()
+    read = scheduler.submit(MSP.ATTITUDE())
+    assert requested.wait(1)
+    scheduler.submit(MSP.SET_RAW_RC(1500, 1500, 1500, 1200))
+    read.result(1)
+    order = sent(events)
+    assert order == [MSP.ATTITUDE.code, MSP.SET_RAW_RC.code]
+    # The setpoint was written before the reply arrived
+    assert events.index((DIRECTION.SEND, MSP.SET_RAW_RC.code)) < events.index(
+        (DIRECTION.RECV, MSP.ATTITUDE.code)
+    )
+
+
+def test_same_code_other_arguments_is_held(link):
+    scheduler, _, events = link
+    futures = [scheduler.submit(MSP.WP(wp_no=n)) for n in (1, 2, 2)]
+    scheduler.start()
+    for future in futures:
+        future.result(1)
+    wp = [e for e in events if e[1] == MSP.WP.code]
+    # Second request only after the first reply, the third shares it
+    assert wp[:3] == [
+        (DIRECTION.SEND, MSP.WP.code),
+        (DIRECTION.RECV, MSP.WP.code),
+        (DIRECTION.SEND, MSP.WP.code),
+    ]
+    assert sent(events).count(MSP.WP.code) == 2
+
+
+def test_retries_then_timeout(link):
+    scheduler, sim, events = link
+    sim.read_commands.pop(MSP.RC.code)
+    scheduler.start()
+    with pytest.raises(RequestTimeout) as error:
+        scheduler.submit(MSP.RC()).result(5)
+    attempts = scheduler.fc.retries + 1
+    assert error.value.attempts == attempts
+    assert sent(events).count(MSP.RC.code) == attempts
+    # The scheduler keeps going
+    assert scheduler.submit(MSP.ATTITUDE()).result(1) is not None
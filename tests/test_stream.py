@@ -0,0 +1,140 @@
+# ===================================================================
+# FrameParser against arbitrary chunk splits and line noise
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import random
+import pytest
+from lib.Stream import PREAMBLE, DIRECTION, FrameParser, crc8, frame
+
+
+class ChunkedSerial:
+    # Fake serial port delivering its data in random chunk sizes
+    def __init__(self, data: bytes, rng: random.Random):
+        self.data = bytearray(data)
+        self.rng = rng
+
+    @property
+    def in_waiting(self) -> int:
+        return min(len(self.data), self.rng.randint(0, 16))
+
+    def read(self, size: int = 1) -> bytes:
+        chunk = bytes(self.data[:size])
+        del self.data[:size]
+        return chunk
+
+
+def noise(rng: random.Random, size: int) -> bytes:
+    # Random bytes without a preamble start, a valid frame cannot hide in it
+    return bytes(rng.choice(range(1, 256)) for _ in range(size)).replace(b"$", b"#")
+
+
+def stream(rng: random.Random, count: int) -> tuple[bytes, list]:
+    # Frames of both versions separated by noise, and the expected frames
+    data, expected = bytearray(), []
+    for _ in range(count):
+        version = rng.choice((1, 2))
+        code = rng.randrange(256) if version == 1 else rng.randrange(65536)
+        payload = rng.randbytes(rng.randrange(256 if version == 1 else 600))
+        data += noise(rng, rng.randrange(8))
+        data += frame(code, payload, version, DIRECTION.RECV)
+        expected.append((code, payload))
+    return bytes(data), expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunk_split_and_noise(seed):
+    rng = random.Random(seed)
+    data, expected = stream(rng, 50)
+    parser = FrameParser(PREAMBLE.RECV)
+    port = ChunkedSerial(data, rng)
+    received = []
+    while (item := parser.read(port)) is not None:
+        received.append(item)
+    assert received == expected
+    assert parser.checksum_errors == 0
+    assert parser.total_bytes == len(data)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_feed_byte_by_byte(seed):
+    rng = random.Random(seed)
+    data, expected = stream(rng, 20)
+    parser = FrameParser(PREAMBLE.RECV)
+    received = []
+    for i in range(len(data)):
+        parser.feed(data[i : i + 1])
+        received.extend(parser)
+    assert received == expected
+
+
+def test_corrupted_frame_is_counted_and_skipped():
+    good = frame(105, b"\x01\x02\x03", 1, DIRECTION.RECV)
+    bad = bytearray(frame(108, b"\x04\x05\x06", 1, DIRECTION.RECV))
+    bad[-2] ^= 0xFF
+    parser = FrameParser(PREAMBLE.RECV)
+    parser.feed(bytes(bad) + good)
+    assert list(parser) == [(105, b"\x01\x02\x03")]
+    assert parser.checksum_errors == 1
+
+
+def test_oversized_v2_header_does_not_stall():
+    # With a payload limit, a v2 header from line noise announcing a huge
+    # payload is dropped instead of holding back the frames behind it
+    bogus = PREAMBLE.RECV_V2 + bytes((0, 0x34, 0x12, 0xFF, 0xFF))
+    good = frame(105, b"\x00" * 32, 1, DIRECTION.RECV)
+    parser = FrameParser(PREAMBLE.RECV, max_payload=1024)
+    parser.feed(bogus)
+    assert parser.needed == 1
+    parser.feed(good)
+    assert list(parser) == [(105, b"\x00" * 32)]
+    assert parser.oversized == 1
+    assert parser.checksum_errors == 0
+
+
+@pytest.mark.parametrize("size", (1025, 2000, 0xFFFF))
+def test_large_v2_frame(size):
+    payload = random.Random(size).randbytes(size)
+    parser = FrameParser(PREAMBLE.RECV)
+    parser.feed(frame(0x1234, payload, 2, DIRECTION.RECV))
+    assert list(parser) == [(0x1234, payload)]
+    assert parser.garbage_bytes == parser.oversized == 0
+
+
+def test_crc8_check_value():
+    # CRC-8/DVB-S2 check value
+    assert crc8(b"123456789") == 0xBC
+
+
+@pytest.mark.parametrize("version", (1, 2))
+@pytest.mark.parametrize("size", (0, 1, 255))
+def test_frame_round_trip(version, size):
+    payload = bytes(range(size))
+    for direction, preamble in (
+        (DIRECTION.SEND, PREAMBLE.SEND),
+        (DIRECTION.RECV, PREAMBLE.RECV),
+    ):
+        parser = FrameParser(preamble)
+        parser.feed(frame(200, payload, version, direction))
+        assert list(parser) == [(200, payload)]
+        assert parser.version == version
+
+
+def test_pinned_protocol():
+    v1 = frame(105, b"\x01", 1, DIRECTION.RECV)
+    v2 = frame(106, b"\x02", 2, DIRECTION.RECV)
+    parser = FrameParser(PREAMBLE.RECV, protocol=1)
+    parser.feed(v2 + v1)
+    assert list(parser) == [(105, b"\x01")]
+    parser = FrameParser(PREAMBLE.RECV, protocol=2)
+    parser.feed(v1 + v2)
+    assert list(parser) == [(106, b"\x02")]
+
+
+def test_wrong_direction_is_ignored():
+    request = frame(105, b"", 1, DIRECTION.SEND)
+    reply = frame(105, b"\x07", 1, DIRECTION.RECV)
+    parser = FrameParser(PREAMBLE.RECV)
+    parser.feed(request + reply)
+    assert list(parser) == [(105, b"\x07")]
@@ -0,0 +1,143 @@
+# ===================================================================
+# Adaptive timeouts, retries and reconnection
+# ===================================================================
+# Author: Yuxuan Zhang, yuxuan@yuxuanzhang.net
+# Published under MIT License
+# ===================================================================
+import pytest
+from lib import MultiWii, MSP, RequestTimeout
+from lib import Transport
+from lib.Simulator import SimulatedFC
+from lib.Timeout import MAX_RTO, MIN_RTO, RTTEstimator, wire_time
+
+
+def test_wire_time():
+    assert wire_time(100, None) == 0.0
+    assert wire_time(1152, 115200) == pytest.approx(0.1)
+
+
+def test_estimator():
+    rtt = RTTEstimator(0.1, 115200)
+    assert rtt.timeout(0) == 0.1
+    assert rtt.timeout(1152) == pytest.approx(0.2)
+    # The wire time of the sample is not part of the latency
+    rtt.sample(0.1 + 0.004, 1152)
+    assert rtt.srtt == pytest.approx(0.004)
+    assert rtt.rto == pytest.approx(0.004 + 4 * 0.002)
+    for _ in range(100):
+        rtt.sample(0.001, 0)
+    assert rtt.srtt == pytest.approx(0.001, rel=1e-3)
+    assert rtt.rto == MIN_RTO
+
+
+def test_backoff_settle_reset():
+    rtt = RTTEstimator(0.1)
+    rtt.sample(0.05, 0)
+    rto = rtt.rto
+    rtt.backoff()
+    assert rtt.rto == 2 * rto
+    for _ in range(20):
+        rtt.backoff()
+    assert rtt.rto == MAX_RTO
+    rtt.settle()
+    assert rtt.rto == rto
+    rtt.reset()
+    assert rtt.srtt is None and rtt.rto == 0.1
+
+
+def test_request_timeout_after_retries():
+    sim = SimulatedFC(timeout=0.1)
+    sim.read_commands.pop(MSP.RC.code)
+    fc = MultiWii(transport=sim, timeout=0.01, retries=2)
+    requests = sim.requests
+    with pytest.raises(RequestTimeout) as error:
+        fc.invoke(MSP.RC())
+    assert error.value.attempts == 3
+    assert sim.requests - requests == 3
+    # Every missed attempt doubled the margin
+    assert fc.rtt.rto == pytest.approx(0.08)
+    # A reply ends the backoff
+    fc.invoke(MSP.ATTITUDE())
+    assert fc.rtt.rto < 0.08
+
+
+class FakePort:
+    # Serial port stand-in that fails once `broken` is set
+    opened = []
+
+    def __init__(self, path=None, baud=None, timeout=None):
+        self.timeout = timeout
+        self.broken = False
+        self.written = []
+        FakePort.opened.append(self)
+
+    def check(self):
+        if self.broken:
+            raise OSError("device disconnected")
+
+    @property
+    def in_waiting(self) -> int:
+        self.check()
+        return 0
+
+    def read(self, size: int = 1) -> bytes:
+        self.check()
+        return b""
+
+    def write(self, data: bytes) -> int:
+        self.check()
+        self.written.append(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    FakePort.opened = []
+    monkeypatch.setattr(Transport, "open_serial", FakePort)
+    monkeypatch.setattr(Transport.serial, "Serial", FakePort)
+    monkeypatch.setattr(Transport, "RECONNECT_DELAY", 0.001)
+    return FakePort.opened
+
+
+def test_reconnect_on_read(ports):
+    port = Transport.ReconnectingSerial("/dev/fake", 115200, 0.1)
+    calls = []
+    port.callbacks.append(lambda: calls.append(port.reconnects))
+    ports[0].broken = True
+    assert port.read(4) == b""
+    assert port.in_waiting == 0
+    assert port.reconnects == 1 and calls == [1]
+    assert port.port is ports[1] and port.timeout == 0.1
+
+
+def test_write_is_repeated_after_reconnect(ports):
+    port = Transport.ReconnectingSerial("/dev/fake", 115200, 0.1)
+    ports[0].broken = True
+    assert port.write(b"abc") == 3
+    assert ports[1].written == [b"abc"]
+
+
+def test_gives_up_after_patience(ports, monkeypatch):
+    port = Transport.ReconnectingSerial("/dev/fake", 115200, 0.1, patience=0.02)
+
+    def gone(*_, **__):
+        raise OSError("no such device")
+
+    monkeypatch.setattr(Transport.serial, "Serial", gone)
+    ports[0].broken = True
+    with pytest.raises(OSError):
+        port.read()
+    assert port.reconnects == 0
+
+
+def test_reconnect_resets_link_state(ports):
+    fc = MultiWii("/dev/fake", timeout=0.1)
+    fc.rtt.sample(0.01, 0)
+    fc.parser.feed(b"$M>\x10")
+    ports[0].broken = True
+    fc.serial.read()
+    assert fc.rtt.srtt is None and fc.rtt.rto == 0.1
+    assert not fc.parser.buffer